@@ -1,15 +1,33 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.models.user import User
 from app.config import settings
+from app.auth_cache import auth_cache, user_to_cache, user_from_cache
 
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Хэши с другим числом раундов считаются устаревшими и перехэшируются при логине
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS
+)
+
+# bcrypt отпускает GIL, поэтому потоков достаточно, чтобы не блокировать event loop
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="bcrypt"
+)
+_hash_jobs_in_flight = 0
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -17,6 +35,30 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def _run_hash_job(func, *args):
+    """Run a bcrypt call on the bounded pool; 429 once workers and queue are full"""
+    global _hash_jobs_in_flight
+    if _hash_jobs_in_flight >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many authentication requests, try again shortly",
+            headers={"Retry-After": "1"}
+        )
+    
+    _hash_jobs_in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_jobs_in_flight -= 1
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_hash_job(pwd_context.hash, password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str):
+    """Returns (is_valid, new_hash); new_hash is set when the stored hash needs a rehash"""
+    return await _run_hash_job(pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     if expires_delta:
@@ -44,17 +86,23 @@ def verify_token(token: str):
             detail="Could not validate credentials"
         )
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     token = credentials.credentials
     username = verify_token(token)
     
-    user = db.query(User).filter(User.username == username).first()
+    # Hot path: attach the cached snapshot to this session without a SELECT
+    cached = await auth_cache.get(username)
+    if cached is not None:
+        return await db.merge(user_from_cache(cached), load=False)
+    
+    user = await db.scalar(select(User).where(User.username == username))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
+    await auth_cache.set(username, user_to_cache(user))
     return user
\ No newline at end of file
@@ -0,0 +1,134 @@
+# app/auth_cache.py
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import DateTime, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from app.config import settings
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# hashed_password никогда не кэшируем (и не кладём в общий backend)
+_EXCLUDED_COLUMNS = {"hashed_password"}
+_USER_COLUMNS = [c for c in User.__table__.columns if c.name not in _EXCLUDED_COLUMNS]
+
+
+def user_to_cache(user: User) -> dict:
+    """Column snapshot of an authenticated user"""
+    return {c.key: getattr(user, c.key) for c in inspect(User).column_attrs
+            if c.key not in _EXCLUDED_COLUMNS}
+
+
+def user_from_cache(values: dict) -> User:
+    """Detached User rebuilt from a snapshot; merge(load=False) attaches it without a SELECT"""
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
+
+
+class LocalAuthCache:
+    """In-process TTL + LRU cache: token subject (username) -> user snapshot"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, username: str) -> Optional[dict]:
+        entry = self._entries.get(username)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[username]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(username)
+        self.hits += 1
+        return entry[1]
+
+    async def set(self, username: str, values: dict):
+        self._entries[username] = (time.monotonic() + self.ttl, values)
+        self._entries.move_to_end(username)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def invalidate(self, *usernames: str):
+        for username in usernames:
+            if username:
+                self._entries.pop(username, None)
+
+    def get_stats(self) -> dict:
+        return {"backend": "memory", "size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class RedisAuthCache:
+    """Shared backend so every worker sees the same entries and invalidations"""
+
+    KEY_PREFIX = "auth:user:"
+
+    def __init__(self, url: str, ttl: float):
+        import redis.asyncio as redis  # optional dependency
+        self.redis = redis.from_url(url)
+        self.ttl = int(ttl)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _encode(values: dict) -> str:
+        return json.dumps({k: v.isoformat() if isinstance(v, datetime) else v for k, v in values.items()})
+
+    @staticmethod
+    def _decode(raw) -> dict:
+        values = json.loads(raw)
+        for column in _USER_COLUMNS:
+            if isinstance(column.type, DateTime) and values.get(column.key):
+                values[column.key] = datetime.fromisoformat(values[column.key])
+        return values
+
+    async def get(self, username: str) -> Optional[dict]:
+        try:
+            raw = await self.redis.get(self.KEY_PREFIX + username)
+        except Exception as e:
+            logger.warning(f"Auth cache unavailable: {e}")
+            return None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._decode(raw)
+
+    async def set(self, username: str, values: dict):
+        try:
+            await self.redis.set(self.KEY_PREFIX + username, self._encode(values), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Auth cache unavailable: {e}")
+
+    async def invalidate(self, *usernames: str):
+        keys = [self.KEY_PREFIX + u for u in usernames if u]
+        if not keys:
+            return
+        try:
+            await self.redis.delete(*keys)
+        except Exception as e:
+            logger.warning(f"Auth cache unavailable: {e}")
+
+    def get_stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+
+def _create_auth_cache():
+    if settings.AUTH_CACHE_BACKEND == "redis":
+        try:
+            return RedisAuthCache(settings.REDIS_URL, settings.AUTH_CACHE_TTL)
+        except ImportError:
+            logger.warning("redis package not installed, falling back to in-memory auth cache")
+    return LocalAuthCache(settings.AUTH_CACHE_TTL, settings.AUTH_CACHE_MAX_SIZE)
+
+
+# global instance
+auth_cache = _create_auth_cache()
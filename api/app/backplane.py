@@ -0,0 +1,197 @@
+# app/backplane.py
+# Pub/sub между воркерами: каждый воркер подписан только на каналы
+# пользователей, чьи сокеты он держит, плюс общий broadcast-канал.
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Iterable, Optional, Tuple
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_CHANNEL = "ws:broadcast"
+
+# handler(channel, envelope) - envelope is the decoded dict published to the channel
+Handler = Callable[[str, dict], Awaitable[None]]
+
+
+def user_channel(user_id: int) -> str:
+    return f"ws:user:{user_id}"
+
+
+class Backplane:
+    """Interface for cross-process WebSocket fan-out"""
+
+    async def start(self, handler: Handler):
+        raise NotImplementedError
+
+    async def stop(self):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str):
+        raise NotImplementedError
+
+    async def unsubscribe(self, channel: str):
+        raise NotImplementedError
+
+    async def publish_many(self, messages: Iterable[Tuple[str, dict]]):
+        raise NotImplementedError
+
+    async def publish(self, channel: str, envelope: dict):
+        await self.publish_many([(channel, envelope)])
+
+
+class InMemoryBackplane(Backplane):
+    """Single-process backplane: publish delivers straight to local subscribers"""
+
+    def __init__(self):
+        self.handler: Optional[Handler] = None
+        self.channels: set = set()
+
+    async def start(self, handler: Handler):
+        self.handler = handler
+        self.channels.add(BROADCAST_CHANNEL)
+
+    async def stop(self):
+        self.channels.clear()
+
+    async def subscribe(self, channel: str):
+        self.channels.add(channel)
+
+    async def unsubscribe(self, channel: str):
+        self.channels.discard(channel)
+
+    async def publish_many(self, messages):
+        for channel, envelope in messages:
+            if self.handler and channel in self.channels:
+                await self.handler(channel, envelope)
+
+
+class RedisBackplane(Backplane):
+    """Redis pub/sub; publishes are pipelined into one round trip"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis  # optional dependency
+        self.redis = redis.from_url(url)
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.handler: Optional[Handler] = None
+        self.listener: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler):
+        self.handler = handler
+        await self.pubsub.subscribe(BROADCAST_CHANNEL)
+        self.listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self.listener:
+            self.listener.cancel()
+        await self.pubsub.close()
+        await self.redis.close()
+
+    async def subscribe(self, channel: str):
+        await self.pubsub.subscribe(channel)
+
+    async def unsubscribe(self, channel: str):
+        await self.pubsub.unsubscribe(channel)
+
+    async def publish_many(self, messages):
+        pipe = self.redis.pipeline(transaction=False)
+        encoded = {}  # fan-out shares one envelope object - encode it once
+        for channel, envelope in messages:
+            payload = encoded.get(id(envelope))
+            if payload is None:
+                payload = encoded[id(envelope)] = json.dumps(envelope)
+            pipe.publish(channel, payload)
+        await pipe.execute()
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self.pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    await self.handler(channel, json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Redis backplane listener error: {e}")
+                await asyncio.sleep(1)
+
+
+class PostgresBackplane(Backplane):
+    """PostgreSQL LISTEN/NOTIFY over a dedicated asyncpg connection.
+
+    NOTIFY payloads are limited to ~8000 bytes; larger frames are dropped
+    with an error log.
+    """
+
+    MAX_PAYLOAD = 7999
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.connection = None
+        self.handler: Optional[Handler] = None
+        # pg identifier -> backplane channel name
+        self.channels: dict = {}
+        # asyncpg connection не допускает параллельных операций
+        self.lock = asyncio.Lock()
+
+    @staticmethod
+    def _pg_channel(channel: str) -> str:
+        # LISTEN takes an identifier: ws:user:42 -> ws_user_42
+        return channel.replace(":", "_")
+
+    async def start(self, handler: Handler):
+        import asyncpg
+        self.handler = handler
+        self.connection = await asyncpg.connect(self.dsn)
+        await self.subscribe(BROADCAST_CHANNEL)
+
+    async def stop(self):
+        if self.connection:
+            await self.connection.close()
+
+    def _on_notify(self, connection, pid, pg_channel, payload):
+        channel = self.channels.get(pg_channel)
+        if channel:
+            asyncio.create_task(self.handler(channel, json.loads(payload)))
+
+    async def subscribe(self, channel: str):
+        pg_channel = self._pg_channel(channel)
+        self.channels[pg_channel] = channel
+        async with self.lock:
+            await self.connection.add_listener(pg_channel, self._on_notify)
+
+    async def unsubscribe(self, channel: str):
+        pg_channel = self._pg_channel(channel)
+        self.channels.pop(pg_channel, None)
+        async with self.lock:
+            await self.connection.remove_listener(pg_channel, self._on_notify)
+
+    async def publish_many(self, messages):
+        args = []
+        encoded = {}  # fan-out shares one envelope object - encode it once
+        for channel, envelope in messages:
+            if id(envelope) not in encoded:
+                payload = json.dumps(envelope)
+                if len(payload.encode()) > self.MAX_PAYLOAD:
+                    logger.error(f"Frame for {channel} exceeds NOTIFY payload limit, dropped")
+                    payload = None
+                encoded[id(envelope)] = payload
+            if encoded[id(envelope)] is not None:
+                args.append((self._pg_channel(channel), encoded[id(envelope)]))
+        if args:
+            async with self.lock:
+                await self.connection.executemany("SELECT pg_notify($1, $2)", args)
+
+
+def create_backplane() -> Backplane:
+    kind = settings.WS_BACKPLANE
+    if kind == "redis":
+        return RedisBackplane(settings.REDIS_URL)
+    if kind == "postgres":
+        return PostgresBackplane(settings.DATABASE_URL)
+    return InMemoryBackplane()
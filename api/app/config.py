@@ -16,12 +16,63 @@ class Settings:
             self.DATABASE_URL = database_url
             
         print(f"[DEBUG] Final DATABASE_URL: {self.DATABASE_URL}")
+        self.ASYNC_DATABASE_URL = self._to_async_url(self.DATABASE_URL)
+        
+        # Connection pool (ignored for SQLite, which uses its own pool defaults)
+        self.DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+        self.DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+        self.DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+        self.DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds, -1 disables
+        self.DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+        
+        # SQLite tuning
+        self.SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() == "true"
+        self.SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
         
         # jwt
         self.SECRET_KEY = os.getenv("SECRET_KEY", "secret-jwt-key")
         self.ALGORITHM = "HS256"
         self.ACCESS_TOKEN_EXPIRE_MINUTES = 10080  # 7 days
         
+        # Password hashing (bcrypt runs on a bounded thread pool, see app/auth.py)
+        self.BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+        self.PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+        self.PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+        
+        # Authenticated-user cache (see app/auth_cache.py)
+        self.AUTH_CACHE_BACKEND = os.getenv("AUTH_CACHE_BACKEND", "memory")  # memory | redis
+        self.AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+        self.AUTH_CACHE_MAX_SIZE = int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000"))
+        self.REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        
+        # WebSocket fan-out (see app/websocket_manager.py)
+        self.WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+        self.WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+        self.WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop")  # drop | coalesce | disconnect
+        self.WS_BACKPLANE = os.getenv("WS_BACKPLANE", "memory")  # memory | redis | postgres
+        
+        # Presence (see app/presence_manager.py)
+        self.PRESENCE_OFFLINE_GRACE = float(os.getenv("PRESENCE_OFFLINE_GRACE", "5"))
+        self.PRESENCE_FLUSH_INTERVAL = float(os.getenv("PRESENCE_FLUSH_INTERVAL", "1"))
+        self.PRESENCE_DB_FLUSH_INTERVAL = float(os.getenv("PRESENCE_DB_FLUSH_INTERVAL", "10"))
+        
+        # User search index (see app/user_search.py)
+        self.USER_SEARCH_REFRESH_INTERVAL = float(os.getenv("USER_SEARCH_REFRESH_INTERVAL", "300"))
+        
+        # Message send dedupe by clientMessageId (see app/services/message_dedupe.py)
+        self.MESSAGE_DEDUPE_TTL = float(os.getenv("MESSAGE_DEDUPE_TTL", "300"))
+        self.MESSAGE_DEDUPE_MAX_SIZE = int(os.getenv("MESSAGE_DEDUPE_MAX_SIZE", "10000"))
+        
+        # Bulk message import (POST /api/messages/import, python -m app.import_messages)
+        # Без токена HTTP-импорт выключен; CLI работает напрямую с БД
+        self.IMPORT_API_TOKEN = os.getenv("IMPORT_API_TOKEN") or None
+        self.IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+        
+        # User directory paging and batch caps
+        self.USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "200"))
+        self.USERS_PAGE_MAX = int(os.getenv("USERS_PAGE_MAX", "1000"))
+        self.USERS_BATCH_MAX_IDS = int(os.getenv("USERS_BATCH_MAX_IDS", "500"))
+        
         # File Upload Settings
         self.UPLOAD_DIR = "static"
         self.MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
@@ -30,6 +81,18 @@ class Settings:
         self.ENVIRONMENT = "development"
         self.DEBUG = True
     
+    def _to_async_url(self, url: str) -> str:
+        """Map a sync DATABASE_URL onto its async driver"""
+        drivers = {
+            "postgresql://": "postgresql+asyncpg://",
+            "sqlite:///": "sqlite+aiosqlite:///",
+            "mysql://": "mysql+aiomysql://",
+        }
+        for prefix, async_prefix in drivers.items():
+            if url.startswith(prefix):
+                return async_prefix + url[len(prefix):]
+        return url
+    
     def _is_invalid_database_url(self, url: str) -> bool:
         """Check if database URL format is invalid"""
         if not url:
@@ -1,12 +1,68 @@
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app.pool_metrics import PoolStats
 
-engine = create_engine(settings.DATABASE_URL)
+
+def _engine_options(url: str) -> dict:
+    """Per-dialect engine kwargs built from Settings"""
+    if url.startswith("sqlite"):
+        # Соединения SQLite переходят между потоками threadpool'а FastAPI
+        return {"connect_args": {"check_same_thread": False}}
+    
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def _tune_sqlite(sync_engine):
+    """WAL + synchronous=NORMAL: readers don't block the writer, fewer fsyncs"""
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if settings.SQLITE_WAL:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+
+# Sync engine: create_all, alembic, CLI scripts and SQLite tests
+engine = create_engine(settings.DATABASE_URL, **_engine_options(settings.DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for request handlers: asyncpg / aiosqlite don't block the event loop
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL, **_engine_options(settings.ASYNC_DATABASE_URL)
+)
+
+if engine.dialect.name == "sqlite":
+    _tune_sqlite(engine)
+    _tune_sqlite(async_engine.sync_engine)
+
+# Pool telemetry, exposed at /health/db-pool
+pool_stats = PoolStats("sync")
+pool_stats.attach(engine)
+async_pool_stats = PoolStats("async")
+async_pool_stats.attach(async_engine.sync_engine)
+
+# expire_on_commit=False - after commit attributes must stay readable without lazy IO
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # base class model
 Base = declarative_base()
 
@@ -16,4 +72,17 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# async dependency used by the routers
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        # Check out the connection up front so pool wait time is measurable
+        started = time.perf_counter()
+        try:
+            await db.connection()
+        except PoolTimeoutError:
+            async_pool_stats.record_wait(started, timed_out=True)
+            raise
+        async_pool_stats.record_wait(started)
+        yield db
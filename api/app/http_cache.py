@@ -0,0 +1,59 @@
+# app/http_cache.py
+# Условные GET: ETag / If-None-Match и Last-Modified / If-Modified-Since.
+# Клиент с актуальной копией получает 304 без тела.
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional
+from fastapi import Request, Response, status
+
+
+def make_etag(parts: Iterable) -> str:
+    """Weak validator over whatever identifies the representation"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite отдает naive datetime; в БД время в UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime]) -> dict:
+    headers = {
+        "ETag": etag,
+        # private: the body depends on the caller; no-cache: revalidate every time
+        "Cache-Control": "private, no-cache",
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_as_utc(last_modified), usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """RFC 9110: If-None-Match wins; If-Modified-Since is only consulted without it"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # weak comparison - W/ prefix ignored on both sides
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag.removeprefix("W/") in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have second precision
+        return _as_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
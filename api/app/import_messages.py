@@ -0,0 +1,58 @@
+# app/import_messages.py
+# CLI для массовой загрузки сообщений из NDJSON (формат - app/services/message_import.py):
+#
+#   cd api && python -m app.import_messages history.ndjson [--batch-size 5000] [--mark-read]
+#   zcat dump.ndjson.gz | python -m app.import_messages -
+#
+# Пишет напрямую в БД из DATABASE_URL; живые клиенты не уведомляются
+# (у процесса нет WebSocket-соединений), новые сообщения они увидят при загрузке.
+import argparse
+import asyncio
+import json
+import sys
+import time
+from app.config import settings
+from app.database import AsyncSessionLocal, async_engine
+from app.services.message_import import import_messages
+
+READ_CHUNK_SIZE = 1 << 20
+
+
+async def _file_chunks(path: str):
+    stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while True:
+            chunk = stream.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+
+async def main(args) -> int:
+    started = time.monotonic()
+    try:
+        async with AsyncSessionLocal() as db:
+            report = await import_messages(
+                db, _file_chunks(args.path), batch_size=args.batch_size, mark_read=args.mark_read
+            )
+    finally:
+        await async_engine.dispose()
+
+    elapsed = time.monotonic() - started
+    summary = report.as_dict()
+    summary["seconds"] = round(elapsed, 2)
+    summary["messages_per_second"] = round(report.inserted / elapsed) if elapsed else None
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load messages from an NDJSON file")
+    parser.add_argument("path", help="NDJSON file, or - for stdin")
+    parser.add_argument("--batch-size", type=int, default=settings.IMPORT_BATCH_SIZE)
+    parser.add_argument("--mark-read", action="store_true",
+                        help="mark imported history as read for every participant")
+    sys.exit(asyncio.run(main(parser.parse_args())))
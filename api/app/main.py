@@ -1,7 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from app.database import engine, Base
+from app.database import engine, async_engine, Base, pool_stats, async_pool_stats
 import logging
 
 # Import models so they register with Base
@@ -10,6 +10,10 @@ from app.models.chat import Chat, ChatParticipant, Contact
 from app.models.message import Message
 
 from app.routers import auth, users, chats, messages, contacts, websocket
+from app.websocket_manager import manager
+from app.presence_manager import presence
+from app.services.message_search import install_search_index
+from app.serializers import ORJSONResponse
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,12 +22,18 @@ logger = logging.getLogger(__name__)
 # Create tables
 Base.metadata.create_all(bind=engine)
 
+# Full-text index lives outside the ORM metadata (FTS5 table / tsvector column)
+with engine.begin() as connection:
+    install_search_index(connection)
+
 app = FastAPI(
     title="Messenger API",
     description="Backend API для мессенджера",
     version="1.0.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    # orjson for every JSON response (stdlib fallback when not installed)
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS properly
@@ -40,6 +50,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # paging and cache validators must be readable by fetch()
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified"],
     allow_origin_regex=r"http://localhost:\d+"
 )
 
@@ -54,6 +66,17 @@ app.include_router(contacts.router, prefix="/api/contacts", tags=["contacts"])
 app.include_router(messages.router, prefix="/api/messages", tags=["messages"])
 app.include_router(websocket.router, tags=["websocket"])
 
+@app.on_event("startup")
+async def start_websocket_backplane():
+    await manager.start()
+    await presence.start()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    await presence.stop()
+    await manager.stop()
+    await async_engine.dispose()
+
 @app.get("/")
 async def root():
     return {"message": "Messenger API is running", "version": "1.0.0"}
@@ -75,4 +98,13 @@ async def api_root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "database": "connected"}
\ No newline at end of file
+    return {"status": "healthy", "database": "connected"}
+
+@app.get("/health/db-pool")
+async def db_pool_stats():
+    """Connection pool checkout / wait telemetry"""
+    return {
+        "dialect": engine.dialect.name,
+        "async": async_pool_stats.snapshot(),
+        "sync": pool_stats.snapshot()
+    }
\ No newline at end of file
@@ -1,15 +1,30 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 class Chat(Base):
     __tablename__ = "chats"
+    __table_args__ = (
+        # Личный чат по паре участников: одна строка на пару (см. app/services/direct_chats.py)
+        Index("ix_chats_dm_pair", "dm_user_low", "dm_user_high", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=True)  # Для групповых чатов
     is_group = Column(Boolean, default=False)
     avatar_url = Column(String(255), nullable=True)
+
+    # Канонический ключ личного чата: (min(user_id), max(user_id)); NULL у групп
+    # и у личных чатов, из которых кто-то вышел
+    dm_user_low = Column(Integer, nullable=True)
+    dm_user_high = Column(Integer, nullable=True)
+
+    # Денормализованный указатель на последнее сообщение (см. app/services/chat_activity.py)
+    # Без FK: messages.chat_id уже ссылается на chats, цикл не нужен
+    last_message_id = Column(Integer, nullable=True)
+    last_message_preview = Column(String(200), nullable=True)
+    last_activity_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -20,6 +35,12 @@ class Chat(Base):
 
 class ChatParticipant(Base):
     __tablename__ = "chat_participants"
+    __table_args__ = (
+        # Проверка членства: WHERE chat_id = ? AND user_id = ?
+        UniqueConstraint("chat_id", "user_id", name="uq_chat_participants_chat_user"),
+        # Список чатов пользователя: WHERE user_id = ?
+        Index("ix_chat_participants_user_chat", "user_id", "chat_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     chat_id = Column(Integer, ForeignKey("chats.id"), nullable=False)
@@ -28,7 +49,10 @@ class ChatParticipant(Base):
     # Настройки участника для этого чата
     is_pinned = Column(Boolean, default=False)
     is_muted = Column(Boolean, default=False)
+    # Устаревший счетчик, больше не обновляется: непрочитанные считаются
+    # от last_read_message_id (см. app/services/read_state.py)
     unread_count = Column(Integer, default=0)
+    last_read_message_id = Column(Integer, nullable=True)
     
     joined_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -38,6 +62,11 @@ class ChatParticipant(Base):
 
 class Contact(Base):
     __tablename__ = "contacts"
+    __table_args__ = (
+        UniqueConstraint("user_id", "contact_user_id", name="uq_contacts_user_contact"),
+        # Обратный поиск для presence: кто держит пользователя в контактах
+        Index("ix_contacts_contact_user", "contact_user_id", "user_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
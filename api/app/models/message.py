@@ -1,10 +1,18 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Keyset-пагинация истории: WHERE chat_id = ? AND (created_at, id) < (?, ?)
+        Index("ix_messages_chat_created_id", "chat_id", "created_at", "id"),
+        # Непрочитанные: WHERE chat_id = ? AND id > last_read_message_id
+        Index("ix_messages_chat_id_id", "chat_id", "id"),
+        # Идемпотентная отправка: повтор с тем же clientMessageId не создает дубль
+        Index("ix_messages_sender_client_id", "sender_id", "client_message_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     chat_id = Column(Integer, ForeignKey("chats.id"), nullable=False)
@@ -13,6 +21,7 @@ class Message(Base):
     content = Column(Text, nullable=False)
     message_type = Column(String(20), default="text")  # text, image, file, voice
     file_url = Column(String(255), nullable=True)  # для медиафайлов
+    client_message_id = Column(String(64), nullable=True)  # ключ идемпотентности от клиента
     
     is_edited = Column(Boolean, default=False)
     edited_at = Column(DateTime(timezone=True), nullable=True)
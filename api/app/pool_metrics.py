@@ -0,0 +1,78 @@
+# app/pool_metrics.py
+import time
+import threading
+from sqlalchemy import event
+
+
+class PoolStats:
+    """Checkout / wait counters for one engine's connection pool"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.wait_count = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.timeouts = 0
+        self._pool = None
+
+    def attach(self, engine):
+        """Subscribe to pool events of a sync Engine (use .sync_engine for async)"""
+        self._pool = engine.pool
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def record_wait(self, started: float, timed_out: bool = False):
+        """Record how long acquiring a connection took (started = perf_counter())"""
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total_ms += elapsed_ms
+            self.wait_max_ms = max(self.wait_max_ms, elapsed_ms)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        pool = self._pool
+        with self._lock:
+            data = {
+                "pool": type(pool).__name__ if pool else None,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "wait": {
+                    "count": self.wait_count,
+                    "avg_ms": round(self.wait_total_ms / self.wait_count, 3) if self.wait_count else 0.0,
+                    "max_ms": round(self.wait_max_ms, 3),
+                    "timeouts": self.timeouts,
+                },
+            }
+        # QueuePool-specific gauges
+        for gauge in ("size", "checkedin", "checkedout", "overflow"):
+            getter = getattr(pool, gauge, None)
+            if callable(getter):
+                data[gauge] = getter()
+        return data
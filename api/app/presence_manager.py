@@ -0,0 +1,166 @@
+# app/presence_manager.py
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import asyncio
+import json
+import logging
+from sqlalchemy import bindparam, select
+from app.auth_cache import auth_cache
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.user import User
+from app.websocket_manager import manager
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceService:
+    """In-memory presence for users connected to this worker.
+
+    - counts sockets per user, so a second device doesn't flip status
+    - offline transitions wait PRESENCE_OFFLINE_GRACE seconds, so a
+      reconnecting phone never produces an offline/online pair
+    - status changes go out as one user_status_batch frame per recipient
+      every PRESENCE_FLUSH_INTERVAL seconds
+    - is_online / last_seen are written to the DB in periodic batches
+    """
+
+    def __init__(self):
+        self.connection_counts: Dict[int, int] = {}
+        self.online: Dict[int, bool] = {}
+        self.last_seen: Dict[int, datetime] = {}
+        # user_id -> users interested in their status (contacts, chat peers)
+        self.audiences: Dict[int, List[int]] = {}
+        self.offline_timers: Dict[int, asyncio.TimerHandle] = {}
+        # changes not yet sent / not yet written
+        self.pending_events: Dict[int, bool] = {}
+        self.pending_writes: Dict[int, bool] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+        for timer in self.offline_timers.values():
+            timer.cancel()
+        self.offline_timers.clear()
+        await self.flush_db()
+
+    def connected(self, user_id: int, audience: List[int]):
+        self.connection_counts[user_id] = self.connection_counts.get(user_id, 0) + 1
+        self.audiences[user_id] = audience
+
+        timer = self.offline_timers.pop(user_id, None)
+        if timer:
+            # reconnected within the grace period - nobody noticed
+            timer.cancel()
+            return
+
+        if not self.online.get(user_id):
+            self._set_status(user_id, True)
+
+    def disconnected(self, user_id: int):
+        count = self.connection_counts.get(user_id, 0) - 1
+        if count > 0:
+            self.connection_counts[user_id] = count
+            return
+
+        self.connection_counts.pop(user_id, None)
+        loop = asyncio.get_running_loop()
+        self.offline_timers[user_id] = loop.call_later(
+            settings.PRESENCE_OFFLINE_GRACE, self._go_offline, user_id
+        )
+
+    def _go_offline(self, user_id: int):
+        self.offline_timers.pop(user_id, None)
+        if self.connection_counts.get(user_id):
+            return
+        self._set_status(user_id, False)
+
+    def _set_status(self, user_id: int, is_online: bool):
+        self.online[user_id] = is_online
+        self.last_seen[user_id] = datetime.now(timezone.utc)
+        self.pending_events[user_id] = is_online
+        self.pending_writes[user_id] = is_online
+
+    def get_statuses(self, user_ids: List[int]) -> Dict[int, bool]:
+        """Online map for users this worker has seen; others are left out"""
+        return {user_id: self.online[user_id] for user_id in user_ids if user_id in self.online}
+
+    async def flush_events(self):
+        """Send accumulated status changes, one batch frame per recipient"""
+        if not self.pending_events:
+            return
+        changes, self.pending_events = self.pending_events, {}
+
+        batches: Dict[int, list] = {}
+        for user_id, is_online in changes.items():
+            status = {
+                "user_id": user_id,
+                "is_online": is_online,
+                "last_seen": self.last_seen[user_id].isoformat()
+            }
+            for recipient_id in self.audiences.get(user_id, []):
+                if recipient_id != user_id:
+                    batches.setdefault(recipient_id, []).append(status)
+
+        await manager.send_personal_messages(
+            (recipient_id, json.dumps({"type": "user_status_batch", "statuses": statuses}))
+            for recipient_id, statuses in batches.items()
+        )
+
+        # audiences of users who stayed offline are no longer needed
+        for user_id, is_online in changes.items():
+            if not is_online and not self.connection_counts.get(user_id):
+                self.audiences.pop(user_id, None)
+
+    async def flush_db(self):
+        """Write accumulated is_online / last_seen changes in one executemany"""
+        if not self.pending_writes:
+            return
+        writes, self.pending_writes = self.pending_writes, {}
+
+        users = User.__table__
+        stmt = users.update().where(users.c.id == bindparam("b_id")).values(
+            is_online=bindparam("b_online"),
+            last_seen=bindparam("b_seen")
+        )
+        params = [
+            {"b_id": user_id, "b_online": is_online, "b_seen": self.last_seen[user_id]}
+            for user_id, is_online in writes.items()
+        ]
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(stmt, params)
+                await db.commit()
+                # cached user snapshots carry is_online
+                usernames = await db.scalars(
+                    select(User.username).where(User.id.in_(list(writes)))
+                )
+                await auth_cache.invalidate(*usernames)
+        except Exception as e:
+            logger.error(f"Presence DB flush failed: {e}")
+            # keep the newest state for the next attempt
+            for user_id, is_online in writes.items():
+                self.pending_writes.setdefault(user_id, is_online)
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        next_db_flush = loop.time() + settings.PRESENCE_DB_FLUSH_INTERVAL
+        while True:
+            await asyncio.sleep(settings.PRESENCE_FLUSH_INTERVAL)
+            try:
+                await self.flush_events()
+                if loop.time() >= next_db_flush:
+                    await self.flush_db()
+                    next_db_flush = loop.time() + settings.PRESENCE_DB_FLUSH_INTERVAL
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Presence flush error: {e}")
+
+# global instance
+presence = PresenceService()
@@ -1,21 +1,24 @@
 # app/routers/auth.py - Минимальная версия
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from datetime import datetime
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import User
 from app.schemas.user import UserCreate, UserLogin, UserResponse, Token
-from app.auth import get_password_hash, verify_password, create_access_token, get_current_user
+from app.auth import get_password_hash_async, verify_and_update_password_async, create_access_token, get_current_user
+from app.auth_cache import auth_cache
+from app.user_search import user_search_index
 
 router = APIRouter()
 
 @router.post("/register", response_model=UserResponse)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
     # Check if user exists
-    existing_user = db.query(User).filter(
+    existing_user = await db.scalar(select(User).where(
         (User.username == user.username) | (User.email == user.email)
-    ).first()
+    ))
     
     if existing_user:
         raise HTTPException(
@@ -24,7 +27,7 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = User(
         username=user.username,
         email=user.email,
@@ -36,29 +39,44 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
+    user_search_index.update_user(db_user)
     return db_user
 
 @router.post("/login", response_model=Token)
-async def login_user(user_credentials: UserLogin, db: Session = Depends(get_db)):
+async def login_user(user_credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """Authenticate user and return access token"""
-    user = db.query(User).filter(
+    user = await db.scalar(select(User).where(
         (User.username == user_credentials.username) | 
         (User.email == user_credentials.username)
-    ).first()
+    ))
     
-    if not user or not verify_password(user_credentials.password, user.hashed_password):
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
     
+    is_valid, new_hash = await verify_and_update_password_async(
+        user_credentials.password, user.hashed_password
+    )
+    if not is_valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password"
+        )
+    
+    # Cost factor changed since this hash was created - store the upgraded one
+    if new_hash:
+        user.hashed_password = new_hash
+    
     # Update user status
     user.last_seen = datetime.utcnow()
     user.is_online = True
-    db.commit()
+    await db.commit()
+    await auth_cache.invalidate(user.username)
     
     # Create token
     access_token = create_access_token(data={"sub": user.username})
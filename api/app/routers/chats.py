@@ -1,16 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, desc, func
-from typing import List
-from app.database import get_db
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import and_, or_, desc, func, select, delete
+from typing import List, Optional
+from app.database import get_async_db
 from app.models.user import User
 from app.models.chat import Chat, ChatParticipant
 from app.models.message import Message
 from app.schemas.message import MessageCreate
 from app.schemas.chat import ChatCreate, ChatResponse, ChatListItem, ChatUpdate
 from app.auth import get_current_user
+from app.serializers import ORJSONResponse, message_row, serialize_chat, serialize_message, serialize_messages, select_messages
+from app.services.chat_list import get_chat_list
+from app.services import chat_export, direct_chats, message_search, message_write, read_state
+from app.services.message_history import get_message_page
 import logging
-from app.websocket_manager import manager
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -21,68 +27,12 @@ async def get_user_chats(
     offset: int = Query(0, ge=0),
     limit: int = Query(50, le=100),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all chats for the current user"""
     try:
-        # Get all chat participants where current user is a member
-        participants = db.query(ChatParticipant).options(
-            joinedload(ChatParticipant.chat),
-            joinedload(ChatParticipant.chat, Chat.participants),
-            joinedload(ChatParticipant.chat, Chat.participants, ChatParticipant.user)
-        ).filter(
-            ChatParticipant.user_id == current_user.id
-        ).offset(offset).limit(limit).all()
-        
-        chat_list = []
-        
-        for participant in participants:
-            chat = participant.chat
-            if not chat:
-                continue
-            
-            # Get last message
-            last_message = db.query(Message).filter(
-                Message.chat_id == chat.id
-            ).order_by(desc(Message.created_at)).first()
-            
-            # For private chats, get other participant
-            user_id = None
-            other_participant = None
-            if not chat.is_group:
-                for p in chat.participants:
-                    if p.user_id != current_user.id:
-                        other_participant = p.user
-                        user_id = p.user_id
-                        break
-            
-            # Build response
-            chat_item = {
-                "id": chat.id,
-                "name": chat.name if chat.is_group else (other_participant.name if other_participant else "Unknown"),
-                "is_group": chat.is_group,
-                "avatarUrl": chat.avatar_url if chat.is_group else (other_participant.avatar_url if other_participant else None),
-                "lastMessage": {
-                    "text": last_message.content if last_message else None,
-                    "time": last_message.created_at if last_message else chat.created_at,
-                    "senderId": last_message.sender_id if last_message else None,
-                    "isRead": True  # Simplified for now
-                },
-                "unreadCount": participant.unread_count,
-                "isPinned": participant.is_pinned,
-                "isMuted": participant.is_muted,
-                "userId": user_id,  # For frontend compatibility
-                "type": "group" if chat.is_group else "private"
-            }
-            chat_list.append(chat_item)
-        
-        # Sort by pinned first, then by last message time
-        chat_list.sort(key=lambda x: (
-            not x["isPinned"], 
-            -(x["lastMessage"]["time"].timestamp() if x["lastMessage"]["time"] else 0)
-        ))
-        
-        return chat_list
+        # Ordering (pinned, then last activity) and pagination happen in SQL
+        return ORJSONResponse(await get_chat_list(db, current_user.id, offset=offset, limit=limit))
         
     except Exception as e:
         logger.error(f"Error getting chats for user {current_user.id}: {e}")
@@ -158,11 +108,17 @@ async def get_user_chats(
 #             detail="Error retrieving chats"
 #         )
 
+async def _serialize_existing_chat(db: AsyncSession, chat: Chat) -> dict:
+    chat_participants = (await db.scalars(select(ChatParticipant).where(
+        ChatParticipant.chat_id == chat.id
+    ))).all()
+    return serialize_chat(chat, chat_participants)
+
 @router.post("/", response_model=dict)
 async def create_chat(
     chat_data: ChatCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create new chat"""
     try:
@@ -178,7 +134,7 @@ async def create_chat(
         print(f"DEBUG: Chat data: {chat_data}")
         
         # Validate participants exist
-        users = db.query(User).filter(User.id.in_(participant_ids)).all()
+        users = (await db.scalars(select(User).where(User.id.in_(participant_ids)))).all()
         if len(users) != len(participant_ids):
             missing_ids = set(participant_ids) - set(u.id for u in users)
             raise HTTPException(
@@ -186,41 +142,14 @@ async def create_chat(
                 detail=f"Participants not found: {missing_ids}"
             )
         
-        # For private chats, check if chat already exists with EXACT same participants
-        if not chat_data.is_group and len(participant_ids) == 2:
-            # Ищем чат с точно такими же участниками
-            existing_chats = db.query(Chat).filter(
-                Chat.is_group == False
-            ).all()
-            
-            for chat in existing_chats:
-                # Получаем всех участников этого чата
-                chat_participants = db.query(ChatParticipant).filter(
-                    ChatParticipant.chat_id == chat.id
-                ).all()
-                chat_participant_ids = [cp.user_id for cp in chat_participants]
-                
-                # Проверяем точное совпадение участников
-                if set(chat_participant_ids) == set(participant_ids):
-                    print(f"DEBUG: Found existing chat {chat.id} with same participants")
-                    
-                    # ИСПРАВЛЕНО: Возвращаем сериализованный объект
-                    return {
-                        "id": chat.id,
-                        "name": chat.name,
-                        "is_group": chat.is_group,
-                        "avatar_url": chat.avatar_url,
-                        "created_at": chat.created_at,
-                        "updated_at": chat.updated_at,
-                        "participants": [
-                            {
-                                "user_id": p.user_id,
-                                "is_pinned": p.is_pinned,
-                                "is_muted": p.is_muted,
-                                "unread_count": p.unread_count
-                            } for p in chat_participants
-                        ]
-                    }
+        # For private chats, return the existing chat for this pair - one indexed lookup
+        pair = sorted(set(participant_ids))
+        is_direct = not chat_data.is_group and len(pair) == 2
+        if is_direct:
+            existing_chat = await direct_chats.find_direct_chat(db, *pair)
+            if existing_chat:
+                print(f"DEBUG: Found existing chat {existing_chat.id} with same participants")
+                return await _serialize_existing_chat(db, existing_chat)
             
             print("DEBUG: No existing chat found, creating new one")
         
@@ -230,8 +159,20 @@ async def create_chat(
             is_group=chat_data.is_group or False,
             avatar_url=chat_data.avatar_url
         )
+        if is_direct:
+            chat.dm_user_low, chat.dm_user_high = direct_chats.dm_pair(*pair)
         db.add(chat)
-        db.flush()  # Get chat.id
+        try:
+            await db.flush()  # Get chat.id
+        except IntegrityError:
+            if not is_direct:
+                raise
+            # Concurrent "open DM" for the same pair won the unique index - return its chat
+            await db.rollback()
+            existing_chat = await direct_chats.find_direct_chat(db, *pair)
+            if not existing_chat:
+                raise
+            return await _serialize_existing_chat(db, existing_chat)
         
         print(f"DEBUG: Created chat with ID: {chat.id}")
         
@@ -248,28 +189,12 @@ async def create_chat(
             db.add(participant)
             participants.append(participant)
         
-        db.commit()
-        db.refresh(chat)
+        await db.commit()
+        await db.refresh(chat)
         
         print(f"DEBUG: Successfully created chat {chat.id} with participants {participant_ids}")
         
-        # ИСПРАВЛЕНО: Возвращаем правильно сериализованный объект
-        return {
-            "id": chat.id,
-            "name": chat.name,
-            "is_group": chat.is_group,
-            "avatar_url": chat.avatar_url,
-            "created_at": chat.created_at,
-            "updated_at": chat.updated_at,
-            "participants": [
-                {
-                    "user_id": p.user_id,
-                    "is_pinned": p.is_pinned,
-                    "is_muted": p.is_muted,
-                    "unread_count": p.unread_count
-                } for p in participants
-            ]
-        }
+        return serialize_chat(chat, participants)
         
     except HTTPException:
         raise
@@ -277,7 +202,7 @@ async def create_chat(
         print(f"ERROR: Failed to create chat: {e}")
         import traceback
         traceback.print_exc()
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to create chat"
@@ -473,16 +398,16 @@ async def create_chat(
 async def get_chat(
     chat_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get specific chat details"""
     # Check if user is participant
-    participant = db.query(ChatParticipant).filter(
+    participant = await db.scalar(select(ChatParticipant).where(
         and_(
             ChatParticipant.chat_id == chat_id,
             ChatParticipant.user_id == current_user.id
         )
-    ).first()
+    ))
     
     if not participant:
         raise HTTPException(
@@ -490,9 +415,9 @@ async def get_chat(
             detail="Not a participant of this chat"
         )
     
-    chat = db.query(Chat).options(
+    chat = (await db.scalars(select(Chat).options(
         joinedload(Chat.participants).joinedload(ChatParticipant.user)
-    ).filter(Chat.id == chat_id).first()
+    ).where(Chat.id == chat_id))).unique().first()
     
     if not chat:
         raise HTTPException(
@@ -507,15 +432,15 @@ async def update_chat_settings(
     chat_id: int,
     chat_update: ChatUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update chat settings for current user"""
-    participant = db.query(ChatParticipant).filter(
+    participant = await db.scalar(select(ChatParticipant).where(
         and_(
             ChatParticipant.chat_id == chat_id,
             ChatParticipant.user_id == current_user.id
         )
-    ).first()
+    ))
     
     if not participant:
         raise HTTPException(
@@ -534,22 +459,22 @@ async def update_chat_settings(
         else:
             setattr(participant, field, value)
     
-    db.commit()
+    await db.commit()
     return {"message": "Chat settings updated"}
 
 @router.post("/{chat_id}/pin")
 async def toggle_chat_pin(
     chat_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Toggle pin status for chat"""
-    participant = db.query(ChatParticipant).filter(
+    participant = await db.scalar(select(ChatParticipant).where(
         and_(
             ChatParticipant.chat_id == chat_id,
             ChatParticipant.user_id == current_user.id
         )
-    ).first()
+    ))
     
     if not participant:
         raise HTTPException(
@@ -558,7 +483,7 @@ async def toggle_chat_pin(
         )
     
     participant.is_pinned = not participant.is_pinned
-    db.commit()
+    await db.commit()
     
     return {"is_pinned": participant.is_pinned, "message": "Chat pin status updated"}
 
@@ -566,15 +491,15 @@ async def toggle_chat_pin(
 async def toggle_chat_mute(
     chat_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Toggle mute status for chat"""
-    participant = db.query(ChatParticipant).filter(
+    participant = await db.scalar(select(ChatParticipant).where(
         and_(
             ChatParticipant.chat_id == chat_id,
             ChatParticipant.user_id == current_user.id
         )
-    ).first()
+    ))
     
     if not participant:
         raise HTTPException(
@@ -583,7 +508,7 @@ async def toggle_chat_mute(
         )
     
     participant.is_muted = not participant.is_muted
-    db.commit()
+    await db.commit()
     
     return {"is_muted": participant.is_muted, "message": "Chat mute status updated"}
 
@@ -591,15 +516,15 @@ async def toggle_chat_mute(
 async def mark_chat_as_read(
     chat_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Mark chat as read (reset unread count)"""
-    participant = db.query(ChatParticipant).filter(
+    participant = await db.scalar(select(ChatParticipant).where(
         and_(
             ChatParticipant.chat_id == chat_id,
             ChatParticipant.user_id == current_user.id
         )
-    ).first()
+    ))
     
     if not participant:
         raise HTTPException(
@@ -607,27 +532,26 @@ async def mark_chat_as_read(
             detail="Not a participant of this chat"
         )
     
-    participant.unread_count = 0
-    db.commit()
+    await message_write.advance_read(db, current_user, chat_id)
     
     return {"message": "Chat marked as read", "unread_count": 0}
 
 @router.get("/{chat_id}/messages")
 async def get_chat_messages(
     chat_id: int,
-    offset: int = Query(0, ge=0),
+    offset: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(50, le=100),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get messages for a chat (alternative endpoint for frontend compatibility)"""
     # Check if user is participant
-    participant = db.query(ChatParticipant).filter(
+    participant = await db.scalar(select(ChatParticipant).where(
         and_(
             ChatParticipant.chat_id == chat_id,
             ChatParticipant.user_id == current_user.id
         )
-    ).first()
+    ))
     
     if not participant:
         raise HTTPException(
@@ -635,48 +559,38 @@ async def get_chat_messages(
             detail="Not a participant of this chat"
         )
     
-    messages = db.query(Message).options(
-        joinedload(Message.sender)
-    ).filter(Message.chat_id == chat_id).order_by(
-        desc(Message.created_at)
-    ).offset(offset).limit(limit).all()
+    messages = (await db.execute(select_messages().where(Message.chat_id == chat_id).order_by(
+        desc(Message.created_at), desc(Message.id)
+    ).offset(offset).limit(limit))).all()
     
     # Convert to frontend-compatible format
-    message_responses = []
-    for msg in messages:
-        message_responses.append({
-            "id": msg.id,
-            "chatId": msg.chat_id,
-            "senderId": msg.sender_id,
-            "senderName": msg.sender.name,
-            "text": msg.content,  # Frontend expects "text"
-            "time": msg.created_at,
-            "type": msg.message_type,
-            "isRead": True,  # Assume read when fetching
-            "isEdited": msg.is_edited
-        })
+    # Read receipts come from the participants' watermarks
+    marks = await read_state.get_read_marks(db, chat_id, current_user.id)
+    message_responses = serialize_messages(messages, current_user.id, marks)
     
     # Mark messages as read
-    participant.unread_count = 0
-    db.commit()
+    await message_write.advance_read(db, current_user, chat_id)
     
-    return list(reversed(message_responses))  # Return in chronological order
+    # Response instance: skips jsonable_encoder, the rows are wire-ready already
+    return ORJSONResponse(list(reversed(message_responses)))  # Return in chronological order
 
-@router.post("/{chat_id}/messages")
-async def send_message_to_chat(
+@router.get("/{chat_id}/messages/history")
+async def get_chat_history(
     chat_id: int,
-    message_data: dict,
+    before: Optional[str] = Query(None, description="Cursor: load older messages"),
+    after: Optional[str] = Query(None, description="Cursor: load newer messages"),
+    limit: int = Query(50, ge=1, le=100),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Send message to chat"""
+    """Get a page of chat history using opaque keyset cursors (frontend compatibility)"""
     # Check if user is participant
-    participant = db.query(ChatParticipant).filter(
+    participant = await db.scalar(select(ChatParticipant).where(
         and_(
             ChatParticipant.chat_id == chat_id,
             ChatParticipant.user_id == current_user.id
         )
-    ).first()
+    ))
     
     if not participant:
         raise HTTPException(
@@ -684,95 +598,131 @@ async def send_message_to_chat(
             detail="Not a participant of this chat"
         )
     
-    # Get message text
-    text = message_data.get("text", "").strip()
-    if not text:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Message text cannot be empty"
+    page = await get_message_page(db, chat_id, before=before, after=after, limit=limit)
+    
+    # Read receipts come from the participants' watermarks
+    marks = await read_state.get_read_marks(db, chat_id, current_user.id)
+    message_responses = serialize_messages(page["messages"], current_user.id, marks)
+    
+    # Only the newest page marks the chat as read
+    if not before and not after:
+        await message_write.advance_read(db, current_user, chat_id)
+    
+    return ORJSONResponse({
+        "messages": message_responses,
+        "next_cursor": page["next_cursor"],
+        "prev_cursor": page["prev_cursor"]
+    })
+
+@router.get("/{chat_id}/messages/search")
+async def search_chat_messages(
+    chat_id: int,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(50, le=100),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Full-text search inside one chat (frontend compatibility)"""
+    # Check if user is participant
+    participant = await db.scalar(select(ChatParticipant).where(
+        and_(
+            ChatParticipant.chat_id == chat_id,
+            ChatParticipant.user_id == current_user.id
         )
+    ))
     
-    # Create message
-    message = Message(
-        chat_id=chat_id,
-        sender_id=current_user.id,
-        content=text,
-        message_type="text"
-    )
+    if not participant:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not a participant of this chat"
+        )
     
-    db.add(message)
+    page = await message_search.search_messages(db, current_user.id, q, chat_id=chat_id, limit=limit)
     
-    # Update unread counts for other participants
-    other_participants = db.query(ChatParticipant).filter(
+    marks = await read_state.get_read_marks(db, chat_id, current_user.id)
+    return [message_search.to_frontend(row, current_user.id, marks) for row in page["messages"]]
+
+@router.get("/{chat_id}/export")
+async def export_chat_history(
+    chat_id: int,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = Query(False),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Stream the whole chat history as NDJSON or CSV (optionally gzipped)"""
+    # Check if user is participant
+    participant = await db.scalar(select(ChatParticipant).where(
         and_(
             ChatParticipant.chat_id == chat_id,
-            ChatParticipant.user_id != current_user.id
+            ChatParticipant.user_id == current_user.id
         )
-    ).all()
+    ))
     
-    for p in other_participants:
-        p.unread_count += 1
+    if not participant:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not a participant of this chat"
+        )
     
-    # Update chat timestamp
-    chat = db.query(Chat).filter(Chat.id == chat_id).first()
-    if chat:
-        chat.updated_at = func.now()
+    media_type, extension = chat_export.EXPORT_FORMATS[format]
+    filename = f"chat-{chat_id}.{extension}"
+    if gzip:
+        media_type, filename = "application/gzip", filename + ".gz"
     
-    db.commit()
-    db.refresh(message)
+    return StreamingResponse(
+        chat_export.export_chat(chat_id, format, compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
-    # Get all chat participants for broadcasting
-    participants = db.query(ChatParticipant).filter(
-        ChatParticipant.chat_id == chat_id
-    ).all()
-    participant_ids = [p.user_id for p in participants]
-    
-    # Create WebSocket message
-    ws_message = {
-        "type": "new_message",
-        "message": {
-            "id": message.id,
-            "chatId": message.chat_id,
-            "senderId": message.sender_id,
-            "senderName": current_user.name,
-            "text": message.content,
-            "time": message.created_at.isoformat(),
-            "type": message.message_type,
-            "isRead": False,
-            "isEdited": False
-        }
-    }
-    
-    # Broadcast via WebSocket
-    await manager.send_to_chat(ws_message, participant_ids)
-    print(f"DEBUG: WebSocket message sent to participants: {participant_ids}")
+@router.post("/{chat_id}/messages")
+async def send_message_to_chat(
+    chat_id: int,
+    message_data: dict,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Send message to chat"""
+    # Get message text
+    text = message_data.get("text", "").strip()
+    if not text:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Message text cannot be empty"
+        )
+    
+    client_message_id = message_data.get("clientMessageId")
+    if client_message_id is not None and not (isinstance(client_message_id, str) and 0 < len(client_message_id) <= 64):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="clientMessageId must be a string of 1-64 characters"
+        )
+    
+    # Read before the write: a duplicate clientMessageId rolls the session back
+    sender_name = current_user.name
+    
+    # Participant check, counters, broadcast and retry dedupe live in the shared write path
+    message = await message_write.create_message(
+        db, current_user, chat_id, text, client_message_id=client_message_id
+    )
     
     # Return in frontend format
-    return {
-        "id": message.id,
-        "chatId": message.chat_id,
-        "senderId": message.sender_id,
-        "senderName": current_user.name,
-        "text": message.content,
-        "time": message.created_at,
-        "type": message.message_type,
-        "isRead": True,
-        "isEdited": False
-    }
+    return serialize_message(message_row(message, sender_name), True)
 
 @router.delete("/{chat_id}")
 async def delete_chat(
     chat_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Leave chat or delete if empty"""
-    participant = db.query(ChatParticipant).filter(
+    participant = await db.scalar(select(ChatParticipant).where(
         and_(
             ChatParticipant.chat_id == chat_id,
             ChatParticipant.user_id == current_user.id
         )
-    ).first()
+    ))
     
     if not participant:
         raise HTTPException(
@@ -781,23 +731,26 @@ async def delete_chat(
         )
     
     # Remove user from chat
-    db.delete(participant)
+    await db.delete(participant)
+    await db.flush()
+    # A private chat with one side gone no longer answers for the pair
+    await direct_chats.release_pair(db, chat_id)
     
     # Check if any participants left
-    remaining_participants = db.query(ChatParticipant).filter(
+    remaining_participants = await db.scalar(select(func.count()).select_from(ChatParticipant).where(
         ChatParticipant.chat_id == chat_id
-    ).count()
+    ))
     
     # If no participants left, delete the chat and its messages
     if remaining_participants == 0:
         # Delete messages first
-        db.query(Message).filter(Message.chat_id == chat_id).delete()
+        await db.execute(delete(Message).where(Message.chat_id == chat_id))
         
         # Delete chat
-        chat = db.query(Chat).filter(Chat.id == chat_id).first()
+        chat = await db.scalar(select(Chat).where(Chat.id == chat_id))
         if chat:
-            db.delete(chat)
+            await db.delete(chat)
     
-    db.commit()
+    await db.commit()
     
     return {"message": "Left chat successfully"}
\ No newline at end of file
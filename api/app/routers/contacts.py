@@ -1,8 +1,9 @@
 # app/routers/contacts.py
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from typing import List
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import User
 from app.models.chat import Contact
 from app.schemas.user import UserResponse
@@ -13,12 +14,12 @@ router = APIRouter()
 @router.get("/", response_model=List[UserResponse])
 async def get_contacts(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user's contacts"""
-    contacts = db.query(User).join(
+    contacts = (await db.scalars(select(User).join(
         Contact, Contact.contact_user_id == User.id
-    ).filter(Contact.user_id == current_user.id).all()
+    ).where(Contact.user_id == current_user.id))).all()
     
     return contacts
 
@@ -26,7 +27,7 @@ async def get_contacts(
 async def add_contact_by_body(
     request_data: dict,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Add contact via POST body"""
     user_id = request_data.get("userId")
@@ -43,7 +44,7 @@ async def add_contact_by_body(
         )
     
     # Check if user exists
-    contact_user = db.query(User).filter(User.id == user_id).first()
+    contact_user = await db.scalar(select(User).where(User.id == user_id))
     if not contact_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -51,10 +52,10 @@ async def add_contact_by_body(
         )
     
     # Check if already in contacts
-    existing_contact = db.query(Contact).filter(
+    existing_contact = await db.scalar(select(Contact).where(
         Contact.user_id == current_user.id,
         Contact.contact_user_id == user_id
-    ).first()
+    ))
     
     if existing_contact:
         raise HTTPException(
@@ -65,7 +66,7 @@ async def add_contact_by_body(
     # Add contact
     contact = Contact(user_id=current_user.id, contact_user_id=user_id)
     db.add(contact)
-    db.commit()
+    await db.commit()
     
     return {"message": "Contact added successfully"}
 
@@ -73,13 +74,13 @@ async def add_contact_by_body(
 async def remove_contact(
     user_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Remove user from contacts"""
-    contact = db.query(Contact).filter(
+    contact = await db.scalar(select(Contact).where(
         Contact.user_id == current_user.id,
         Contact.contact_user_id == user_id
-    ).first()
+    ))
     
     if not contact:
         raise HTTPException(
@@ -87,8 +88,8 @@ async def remove_contact(
             detail="Contact not found"
         )
     
-    db.delete(contact)
-    db.commit()
+    await db.delete(contact)
+    await db.commit()
     
     return {"message": "Contact removed successfully"}
 
@@ -98,11 +99,11 @@ async def remove_contact(
 async def check_is_contact(
     user_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Check if user is in contacts"""
     # Сначала проверим что пользователь существует
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         # Вот ТУТ правильно использовать 404 - пользователь не существует
         raise HTTPException(
@@ -110,10 +111,10 @@ async def check_is_contact(
             detail="User not found"
         )
     
-    contact = db.query(Contact).filter(
+    contact = await db.scalar(select(Contact).where(
         Contact.user_id == current_user.id,
         Contact.contact_user_id == user_id
-    ).first()
+    ))
     
     is_contact = bool(contact)
     print(f"[DEBUG] User {current_user.id} checking contact {user_id}: {is_contact}")
@@ -1,16 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, desc, func
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, desc, func, select, tuple_
+from typing import List, Optional
 from datetime import datetime
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import User
 from app.models.chat import Chat, ChatParticipant
 from app.models.message import Message
-from app.schemas.message import MessageCreate, MessageResponse, MessageUpdate, MessageListResponse
+from app.schemas.message import MessageCreate, MessageUpdate
+from app.serializers import ORJSONResponse, message_row, serialize_message, serialize_messages, select_messages
 from app.auth import get_current_user
-from app.websocket_manager import manager
+from app.config import settings
+from app.services import message_import, message_search, message_write, read_state
+from app.services.message_history import get_message_page
 import logging
+import secrets
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -20,19 +24,19 @@ router = APIRouter()
 @router.get("/chat/{chat_id}")
 async def get_chat_messages(
     chat_id: int,
-    offset: int = Query(0, ge=0),
+    offset: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(50, le=100),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get messages for a chat"""
     # Check if user is participant
-    participant = db.query(ChatParticipant).filter(
+    participant = await db.scalar(select(ChatParticipant).where(
         and_(
             ChatParticipant.chat_id == chat_id,
             ChatParticipant.user_id == current_user.id
         )
-    ).first()
+    ))
     
     if not participant:
         raise HTTPException(
@@ -40,38 +44,66 @@ async def get_chat_messages(
             detail="Not a participant of this chat"
         )
     
-    messages = db.query(Message).options(
-        joinedload(Message.sender)
-    ).filter(Message.chat_id == chat_id).order_by(
-        desc(Message.created_at)
-    ).offset(offset).limit(limit).all()
+    messages = (await db.execute(select_messages().where(Message.chat_id == chat_id).order_by(
+        desc(Message.created_at), desc(Message.id)
+    ).offset(offset).limit(limit))).all()
     
     # Convert to frontend-compatible format
-    message_responses = []
-    for msg in messages:
-        message_responses.append({
-            "id": msg.id,
-            "chatId": msg.chat_id,
-            "senderId": msg.sender_id,
-            "senderName": msg.sender.name,
-            "text": msg.content,  # Frontend expects "text", not "content"
-            "time": msg.created_at,
-            "type": msg.message_type,
-            "isRead": True,  # Assume read when fetching
-            "isEdited": msg.is_edited
-        })
+    # Read receipts come from the participants' watermarks
+    marks = await read_state.get_read_marks(db, chat_id, current_user.id)
+    message_responses = serialize_messages(messages, current_user.id, marks)
     
     # Mark chat as read when loading messages
-    participant.unread_count = 0
-    db.commit()
+    await message_write.advance_read(db, current_user, chat_id)
     
-    return list(reversed(message_responses))  # Return in chronological order
+    # Response instance: skips jsonable_encoder, the rows are wire-ready already
+    return ORJSONResponse(list(reversed(message_responses)))  # Return in chronological order
+
+@router.get("/chat/{chat_id}/history")
+async def get_chat_history(
+    chat_id: int,
+    before: Optional[str] = Query(None, description="Cursor: load older messages"),
+    after: Optional[str] = Query(None, description="Cursor: load newer messages"),
+    limit: int = Query(50, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a page of chat history using opaque keyset cursors"""
+    # Check if user is participant
+    participant = await db.scalar(select(ChatParticipant).where(
+        and_(
+            ChatParticipant.chat_id == chat_id,
+            ChatParticipant.user_id == current_user.id
+        )
+    ))
+    
+    if not participant:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not a participant of this chat"
+        )
+    
+    page = await get_message_page(db, chat_id, before=before, after=after, limit=limit)
+    
+    # Read receipts come from the participants' watermarks
+    marks = await read_state.get_read_marks(db, chat_id, current_user.id)
+    message_responses = serialize_messages(page["messages"], current_user.id, marks)
+    
+    # Only the newest page marks the chat as read
+    if not before and not after:
+        await message_write.advance_read(db, current_user, chat_id)
+    
+    return ORJSONResponse({
+        "messages": message_responses,
+        "next_cursor": page["next_cursor"],
+        "prev_cursor": page["prev_cursor"]
+    })
 
 @router.post("/")
 async def send_message(
     message_data: MessageCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Send a message to a chat"""
     try:
@@ -86,82 +118,21 @@ async def send_message(
                 detail="chat_id and content are required"
             )
         
-        # Check if user is participant of the chat
-        participant = db.query(ChatParticipant).filter(
-            and_(
-                ChatParticipant.chat_id == chat_id,
-                ChatParticipant.user_id == current_user.id
-            )
-        ).first()
-        
-        if not participant:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not a participant of this chat"
-            )
+        # Read before the write: a duplicate clientMessageId rolls the session
+        # back, which expires current_user
+        sender_name = current_user.name
         
-        # Create message
-        message = Message(
-            chat_id=chat_id,
-            sender_id=current_user.id,
-            content=content,
-            message_type=message_type
+        # Retries with the same clientMessageId return the original message
+        message = await message_write.create_message(
+            db, current_user, chat_id, content, message_type, message_data.client_message_id
         )
         
-        db.add(message)
-        db.flush()  # Get message.id
-        
-        # Update unread count for other participants
-        other_participants = db.query(ChatParticipant).filter(
-            and_(
-                ChatParticipant.chat_id == chat_id,
-                ChatParticipant.user_id != current_user.id
-            )
-        ).all()
-        
-        participant_ids = [current_user.id]  # Include sender
-        for p in other_participants:
-            p.unread_count += 1
-            participant_ids.append(p.user_id)
-        
-        db.commit()
-        db.refresh(message)
-        
-        # Create WebSocket message for real-time updates
-        ws_message = {
-            "type": "new_message",
-            "message": {
-                "id": message.id,
-                "chatId": message.chat_id,
-                "senderId": message.sender_id,
-                "senderName": current_user.name,
-                "text": message.content,
-                "time": message.created_at.isoformat(),
-                "type": message.message_type,
-                "isRead": False,
-                "isEdited": False
-            }
-        }
-        
-        # Broadcast to all chat participants via WebSocket
-        await manager.send_to_chat(ws_message, participant_ids)
-        
         # Return frontend-compatible response
-        return {
-            "id": message.id,
-            "chatId": message.chat_id,
-            "senderId": message.sender_id,
-            "senderName": current_user.name,
-            "text": message.content,
-            "time": message.created_at,
-            "type": message.message_type,
-            "isRead": False,
-            "isEdited": False
-        }
+        return serialize_message(message_row(message, sender_name), False)
         
     except Exception as e:
         logger.error(f"Error sending message: {e}")
-        db.rollback()
+        await db.rollback()
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(
@@ -169,29 +140,45 @@ async def send_message(
             detail="Error sending message"
         )
 
-@router.put("/{message_id}")
-async def edit_message(
-    message_id: int,
-    message_update: MessageUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+@router.post("/import")
+async def import_messages(
+    request: Request,
+    broadcast: bool = Query(False, description="Push new_message frames to online participants"),
+    mark_read: bool = Query(False, alias="markRead", description="Mark imported history as read for everyone"),
+    batch_size: int = Query(settings.IMPORT_BATCH_SIZE, alias="batchSize", ge=1, le=50000),
+    x_import_token: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Edit a message"""
-    message = db.query(Message).filter(Message.id == message_id).first()
+    """Bulk-load an NDJSON stream of messages (application/x-ndjson body).
     
-    if not message:
+    Service endpoint for migrations and bot replays: authorized by the
+    X-Import-Token header (IMPORT_API_TOKEN), not by a user token.
+    """
+    if not settings.IMPORT_API_TOKEN:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Message not found"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Bulk import is disabled"
         )
-    
-    if message.sender_id != current_user.id:
+    if not x_import_token or not secrets.compare_digest(x_import_token, settings.IMPORT_API_TOKEN):
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Can only edit your own messages"
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid import token"
         )
     
-    # Update message content
+    report = await message_import.import_messages(
+        db, request.stream(), batch_size=batch_size, broadcast=broadcast, mark_read=mark_read
+    )
+    logger.info(f"Bulk import: {report.inserted} inserted, {report.skipped} skipped, {report.failed} failed")
+    return report.as_dict()
+
+@router.put("/{message_id}")
+async def edit_message(
+    message_id: int,
+    message_update: MessageUpdate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Edit a message"""
     new_content = getattr(message_update, 'content', None) or getattr(message_update, 'text', None)
     if not new_content:
         raise HTTPException(
@@ -199,89 +186,20 @@ async def edit_message(
             detail="Content is required"
         )
     
-    message.content = new_content
-    message.is_edited = True
-    message.edited_at = datetime.utcnow()
-    
-    db.commit()
-    db.refresh(message)
-    
-    # Broadcast edit via WebSocket
-    ws_message = {
-        "type": "message_edited",
-        "message": {
-            "id": message.id,
-            "chatId": message.chat_id,
-            "text": message.content,
-            "isEdited": True,
-            "editedAt": message.edited_at.isoformat()
-        }
-    }
-    
-    # Get chat participants for broadcasting
-    participants = db.query(ChatParticipant).filter(
-        ChatParticipant.chat_id == message.chat_id
-    ).all()
-    participant_ids = [p.user_id for p in participants]
-    
-    await manager.send_to_chat(ws_message, participant_ids)
+    message = await message_write.edit_message(db, current_user, message_id, new_content)
     
-    return {
-        "id": message.id,
-        "chatId": message.chat_id,
-        "senderId": message.sender_id,
-        "senderName": current_user.name,
-        "text": message.content,
-        "time": message.created_at,
-        "type": message.message_type,
-        "isRead": True,
-        "isEdited": message.is_edited,
-        "editedAt": message.edited_at
-    }
+    response = serialize_message(message_row(message, current_user.name), True)
+    response["editedAt"] = message.edited_at.isoformat() if message.edited_at else None
+    return response
 
 @router.delete("/{message_id}")
 async def delete_message(
     message_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a message"""
-    message = db.query(Message).filter(Message.id == message_id).first()
-    
-    if not message:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Message not found"
-        )
-    
-    if message.sender_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Can only delete your own messages"
-        )
-    
-    chat_id = message.chat_id
-    
-    # Delete the message
-    db.delete(message)
-    db.commit()
-    
-    # Broadcast deletion via WebSocket
-    ws_message = {
-        "type": "message_deleted",
-        "message": {
-            "id": message_id,
-            "chatId": chat_id
-        }
-    }
-    
-    # Get chat participants for broadcasting
-    participants = db.query(ChatParticipant).filter(
-        ChatParticipant.chat_id == chat_id
-    ).all()
-    participant_ids = [p.user_id for p in participants]
-    
-    await manager.send_to_chat(ws_message, participant_ids)
+    await message_write.delete_message(db, current_user, message_id)
     
     return {"message": "Message deleted successfully", "id": message_id}
 
@@ -291,16 +209,16 @@ async def search_messages(
     q: str = Query(..., min_length=1),
     limit: int = Query(50, le=100),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Search messages in a chat"""
+    """Search messages in a chat (full-text, best matches first)"""
     # Check if user is participant
-    participant = db.query(ChatParticipant).filter(
+    participant = await db.scalar(select(ChatParticipant).where(
         and_(
             ChatParticipant.chat_id == chat_id,
             ChatParticipant.user_id == current_user.id
         )
-    ).first()
+    ))
     
     if not participant:
         raise HTTPException(
@@ -308,31 +226,29 @@ async def search_messages(
             detail="Not a participant of this chat"
         )
     
-    messages = db.query(Message).options(
-        joinedload(Message.sender)
-    ).filter(
-        and_(
-            Message.chat_id == chat_id,
-            Message.content.ilike(f"%{q}%")
-        )
-    ).order_by(desc(Message.created_at)).limit(limit).all()
+    page = await message_search.search_messages(db, current_user.id, q, chat_id=chat_id, limit=limit)
     
-    # Convert to frontend format
-    message_responses = []
-    for msg in messages:
-        message_responses.append({
-            "id": msg.id,
-            "chatId": msg.chat_id,
-            "senderId": msg.sender_id,
-            "senderName": msg.sender.name,
-            "text": msg.content,
-            "time": msg.created_at,
-            "type": msg.message_type,
-            "isRead": True,
-            "isEdited": msg.is_edited
-        })
+    marks = await read_state.get_read_marks(db, chat_id, current_user.id)
+    return [message_search.to_frontend(row, current_user.id, marks) for row in page["messages"]]
+
+@router.get("/search/global")
+async def search_all_messages(
+    q: str = Query(..., min_length=1),
+    chat_id: Optional[int] = Query(None, description="Restrict to one chat"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Full-text search across all chats of the current user, ranked, with snippets"""
+    page = await message_search.search_messages(
+        db, current_user.id, q, chat_id=chat_id, cursor=cursor, limit=limit
+    )
     
-    return message_responses
+    return {
+        "messages": [message_search.to_frontend(row) for row in page["messages"]],
+        "next_cursor": page["next_cursor"]
+    }
 
 @router.get("/before/{message_id}")
 async def get_messages_before(
@@ -340,16 +256,16 @@ async def get_messages_before(
     chat_id: int = Query(...),
     limit: int = Query(20, le=50),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get messages before a specific message (for pagination)"""
     # Check if user is participant
-    participant = db.query(ChatParticipant).filter(
+    participant = await db.scalar(select(ChatParticipant).where(
         and_(
             ChatParticipant.chat_id == chat_id,
             ChatParticipant.user_id == current_user.id
         )
-    ).first()
+    ))
     
     if not participant:
         raise HTTPException(
@@ -357,45 +273,38 @@ async def get_messages_before(
             detail="Not a participant of this chat"
         )
     
-    # Get the reference message to get its timestamp
-    ref_message = db.query(Message).filter(Message.id == message_id).first()
+    # Get the reference message position
+    ref_message = (await db.execute(select(Message.created_at, Message.id).where(
+        Message.id == message_id,
+        Message.chat_id == chat_id
+    ))).first()
     if not ref_message:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Reference message not found"
         )
     
-    messages = db.query(Message).options(
-        joinedload(Message.sender)
-    ).filter(
+    # Compare (created_at, id) so messages sharing a timestamp are not skipped
+    messages = (await db.execute(select_messages().where(
         and_(
             Message.chat_id == chat_id,
-            Message.created_at < ref_message.created_at
+            tuple_(Message.created_at, Message.id) < tuple_(ref_message.created_at, ref_message.id)
         )
-    ).order_by(desc(Message.created_at)).limit(limit).all()
+    ).order_by(desc(Message.created_at), desc(Message.id)).limit(limit))).all()
     
     # Convert to frontend format
-    message_responses = []
-    for msg in messages:
-        message_responses.append({
-            "id": msg.id,
-            "chatId": msg.chat_id,
-            "senderId": msg.sender_id,
-            "senderName": msg.sender.name,
-            "text": msg.content,
-            "time": msg.created_at,
-            "type": msg.message_type,
-            "isRead": True,
-            "isEdited": msg.is_edited
-        })
+    # Read receipts come from the participants' watermarks
+    marks = await read_state.get_read_marks(db, chat_id, current_user.id)
+    message_responses = serialize_messages(messages, current_user.id, marks)
     
-    return list(reversed(message_responses))  # Return in chronological order
+    # Response instance: skips jsonable_encoder, the rows are wire-ready already
+    return ORJSONResponse(list(reversed(message_responses)))  # Return in chronological order
 
 @router.post("/mark-read")
 async def mark_message_as_read(
     request_data: dict,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Mark a specific message as read"""
     message_id = request_data.get("messageId")
@@ -405,29 +314,14 @@ async def mark_message_as_read(
             detail="messageId is required"
         )
     
-    message = db.query(Message).filter(Message.id == message_id).first()
+    message = await db.scalar(select(Message).where(Message.id == message_id))
     if not message:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Message not found"
         )
     
-    # Check if user is participant of the chat
-    participant = db.query(ChatParticipant).filter(
-        and_(
-            ChatParticipant.chat_id == message.chat_id,
-            ChatParticipant.user_id == current_user.id
-        )
-    ).first()
-    
-    if not participant:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not a participant of this chat"
-        )
-    
-    # For simplicity, just mark the entire chat as read
-    participant.unread_count = 0
-    db.commit()
+    # Everything up to this message counts as read
+    await message_write.mark_chat_read(db, current_user, message.chat_id, message.id)
     
     return {"message": "Message marked as read"}
\ No newline at end of file
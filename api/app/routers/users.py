@@ -1,14 +1,19 @@
 # app/routers/users.py - Полная версия
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from typing import List, Optional
 from datetime import datetime
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import User
 from app.models.chat import Contact
 from app.schemas.user import UserResponse, UserUpdate, UsernameCheck
 from app.auth import get_current_user
+from app.auth_cache import auth_cache
+from app.config import settings
+from app.http_cache import cache_headers, is_not_modified, make_etag, not_modified_response
+from app.presence_manager import presence
+from app.user_search import user_search_index
 
 router = APIRouter()
 
@@ -26,21 +31,23 @@ async def get_current_user_profile(current_user: User = Depends(get_current_user
 async def update_current_user_put(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update current user profile via PUT"""
     # Check username availability if changing
     if user_update.username and user_update.username != current_user.username:
-        existing = db.query(User).filter(
+        existing = await db.scalar(select(User).where(
             User.username == user_update.username,
             User.id != current_user.id
-        ).first()
+        ))
         if existing:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already taken"
             )
     
+    previous_username = current_user.username
+    
     # Update fields
     for field, value in user_update.dict(exclude_unset=True).items():
         if field == "avatarUrl":  # Handle alias
@@ -49,15 +56,19 @@ async def update_current_user_put(
             setattr(current_user, field, value)
     
     current_user.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
+    
+    # Cached identity is stale now; tokens issued for the old username must stop resolving
+    await auth_cache.invalidate(previous_username, current_user.username)
+    user_search_index.update_user(current_user)
     return current_user
 
 @router.patch("/me", response_model=UserResponse) 
 async def update_current_user_patch(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update current user profile via PATCH"""
     return await update_current_user_put(user_update, current_user, db)
@@ -66,51 +77,94 @@ async def update_current_user_patch(
 async def check_username_availability(
     username: str = Query(..., min_length=2),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Check if username is available"""
-    existing = db.query(User).filter(
+    existing = await db.scalar(select(User).where(
         User.username == username,
         User.id != current_user.id
-    ).first()
+    ))
     return {"available": not bool(existing)}
 
 @router.get("/", response_model=List[UserResponse])
 async def get_all_users(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = Query(None, description="Last user id of the previous page"),
+    limit: int = Query(settings.USERS_PAGE_SIZE, ge=1, le=settings.USERS_PAGE_MAX),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all users (for UserService.preloadAllUsers)"""
-    users = db.query(User).filter(User.id != current_user.id).all()
+    """Get users page by page (for UserService.preloadAllUsers).
+    
+    Keyset pagination by id; the next page's cursor comes back in X-Next-Cursor
+    (absent on the last page). Pages carry ETag / Last-Modified, a client with
+    a fresh copy gets 304 without a body.
+    """
+    query = select(User).where(User.id != current_user.id)
+    if cursor is not None:
+        query = query.where(User.id > cursor)
+    users = (await db.scalars(query.order_by(User.id).limit(limit + 1))).all()
+    
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = users[-1].id
+    
+    # updated_at is bumped on every profile / presence write, so it covers the whole row
+    versions = [(user.id, user.updated_at or user.created_at) for user in users]
+    last_modified = max((version for _, version in versions if version is not None), default=None)
+    etag = make_etag([current_user.id, cursor, limit, *versions])
+    
+    headers = cache_headers(etag, last_modified)
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(headers)
+    
+    response.headers.update(headers)
     return users
 
+def _capped_user_ids(request_data: dict) -> list:
+    user_ids = request_data.get("userIds", [])
+    if len(user_ids) > settings.USERS_BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many userIds (max {settings.USERS_BATCH_MAX_IDS})"
+        )
+    return user_ids
+
 @router.post("/batch", response_model=List[UserResponse])
 async def get_users_by_ids(
     request_data: dict,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get multiple users by their IDs"""
-    user_ids = request_data.get("userIds", [])
+    user_ids = _capped_user_ids(request_data)
     if not user_ids:
         return []
     
-    users = db.query(User).filter(User.id.in_(user_ids)).all()
+    users = (await db.scalars(select(User).where(User.id.in_(user_ids)))).all()
     return users
 
 @router.post("/status", response_model=dict)
 async def get_users_status(
     request_data: dict,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get online status for multiple users"""
-    user_ids = request_data.get("userIds", [])
+    user_ids = _capped_user_ids(request_data)
     if not user_ids:
         return {}
     
-    users = db.query(User).filter(User.id.in_(user_ids)).all()
-    status_map = {user.id: user.is_online for user in users}
+    # Live state first; only users this worker never saw fall back to the DB
+    status_map = presence.get_statuses(user_ids)
+    missing = [user_id for user_id in user_ids if user_id not in status_map]
+    if missing:
+        rows = await db.execute(select(User.id, User.is_online).where(User.id.in_(missing)))
+        status_map.update({user_id: is_online for user_id, is_online in rows})
     return status_map
 
 @router.get("/search", response_model=List[UserResponse])
@@ -118,29 +172,33 @@ async def search_users(
     q: str = Query(..., min_length=2, description="Search query"),
     limit: int = Query(20, le=50),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Search users by name or username"""
-    users = db.query(User).filter(
-        User.id != current_user.id,  # Exclude current user
-        or_(
-            User.username.ilike(f"%{q}%"),
-            User.name.ilike(f"%{q}%"),
-            User.bio.ilike(f"%{q}%")
-        )
-    ).limit(limit).all()
+    """Search users by name, username or bio (ranked, contacts first among equals)"""
+    await user_search_index.ensure_fresh(db)
     
-    return users
+    contact_ids = await db.scalars(select(Contact.contact_user_id).where(
+        Contact.user_id == current_user.id
+    ))
+    user_ids = user_search_index.search(
+        q, limit=limit, exclude_id=current_user.id, contact_ids=contact_ids
+    )
+    if not user_ids:
+        return []
+    
+    # One PK lookup for the page, then restore the ranking order
+    users = {user.id: user for user in await db.scalars(select(User).where(User.id.in_(user_ids)))}
+    return [users[user_id] for user_id in user_ids if user_id in users]
 
 # ЭТОТ ЭНДПОИНТ ДОЛЖЕН БЫТЬ ПОСЛЕДНИМ (он перехватывает все /{что-то})
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user_by_id(
     user_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user by ID"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1,77 +1,90 @@
 # app/routers/websocket.py 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import select
 import json
 import logging
-from app.database import get_db
+from app.database import AsyncSessionLocal
 from app.models.user import User
 from app.websocket_manager import manager
+from app.presence_manager import presence
+from app.ws_commands import CommandHandler
+from app.ws_metrics import render_prometheus
 from app.auth import verify_token
+from app.auth_cache import auth_cache, user_to_cache, user_from_cache
+from app.services.presence import get_presence_audience
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-async def get_user_from_token(token: str, db: Session) -> User:
-    """Verify token and get user for websocket connection"""
+async def get_user_from_token(token: str) -> User:
+    """Verify token and get a detached user snapshot for the connection"""
     try:
         username = verify_token(token)
-        user = db.query(User).filter(User.username == username).first()
-        if not user:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
-        return user
     except Exception:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    
+    cached = await auth_cache.get(username)
+    if cached is not None:
+        return user_from_cache(cached)
+    
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(User).where(User.username == username))
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    await auth_cache.set(username, user_to_cache(user))
+    return user
 
 @router.websocket("/ws/{token}")
 async def websocket_endpoint(websocket: WebSocket, token: str):
-    """WebSocket connection endpoint"""
-    db = next(get_db())
+    """WebSocket connection endpoint
     
+    No DB session is held while the socket is idle: auth, the presence
+    audience and each command check out a connection only briefly.
+    """
     try:
         # Verify token and get user
-        user = await get_user_from_token(token, db)
+        user = await get_user_from_token(token)
     except:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
     
     await manager.connect(websocket, user.id)
     
-    # Update user online status
-    user.is_online = True
-    db.commit()
-    await manager.broadcast_user_status(user.id, True)
+    # Only contacts and chat peers care about this user's status
+    async with AsyncSessionLocal() as db:
+        presence_audience = await get_presence_audience(db, user.id)
+    presence.connected(user.id, presence_audience)
+    
+    # Authenticated once here; every command on this socket runs as this user
+    commands = CommandHandler(user)
     
     try:
         while True:
             data = await websocket.receive_text()
-            message_data = json.loads(data)
-            
-            # Simple message handling
-            message_type = message_data.get("type")
-            logger.info(f"Received WebSocket message: {message_type} from user {user.id}")
             
-            # Echo back for now (can be expanded later)
-            await websocket.send_text(json.dumps({
-                "type": "message_received",
-                "original": message_data,
-                "user_id": user.id
-            }))
+            reply = await commands.handle(data)
+            if reply is not None:
+                manager.send_to_connection(websocket, json.dumps(reply))
             
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
-        
-        # Update user offline status
-        user.is_online = False
-        db.commit()
-        await manager.broadcast_user_status(user.id, False)
-        
+        pass
     except Exception as e:
         logger.error(f"WebSocket error for user {user.id}: {e}")
-        manager.disconnect(websocket)
     finally:
-        db.close()
+        manager.disconnect(websocket)
+        # offline is debounced and written to the DB in batches
+        presence.disconnected(user.id)
 
 @router.get("/ws/stats")
 async def get_websocket_stats():
     """Get WebSocket connection statistics"""
-    return manager.get_stats()
\ No newline at end of file
+    return manager.get_stats()
+
+@router.get("/ws/metrics", response_class=PlainTextResponse)
+async def get_websocket_metrics():
+    """WebSocket statistics in the Prometheus text exposition format"""
+    return PlainTextResponse(
+        render_prometheus(manager.get_stats()),
+        media_type="text/plain; version=0.0.4"
+    )
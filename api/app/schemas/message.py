@@ -9,6 +9,16 @@ class MessageBase(BaseModel):
 
 class MessageCreate(MessageBase):
     chat_id: int = Field(alias="chatId")
+    client_message_id: Optional[str] = Field(None, min_length=1, max_length=64, alias="clientMessageId")
+
+# One NDJSON line of a bulk import (see app/services/message_import.py)
+class MessageImportRecord(BaseModel):
+    chat_id: int = Field(alias="chatId")
+    sender_id: int = Field(alias="senderId")
+    content: str = Field(..., min_length=1, max_length=4000, alias="text")
+    message_type: str = Field(default="text", pattern="^(text|image|file|voice)$", alias="type")
+    created_at: Optional[datetime] = Field(None, alias="time")
+    client_message_id: Optional[str] = Field(None, min_length=1, max_length=64, alias="clientMessageId")
 
 class MessageUpdate(BaseModel):
     content: str = Field(..., min_length=1, max_length=4000, alias="text")
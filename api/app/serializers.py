@@ -0,0 +1,125 @@
+# app/serializers.py
+# Общий формат ответа для сообщений и чатов: dict для фронтенда собирается
+# прямо из кортежей строк, без ORM-объектов и Pydantic-валидаторов.
+# Время отдается ISO-строкой - так же, как раньше его кодировал jsonable_encoder.
+from typing import Any, Iterable, List, Sequence, Tuple
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from app.models.message import Message
+from app.models.user import User
+from app.services.read_state import is_read
+
+try:
+    import orjson  # optional dependency, see requirements.txt
+except ImportError:
+    orjson = None
+
+
+class ORJSONResponse(JSONResponse):
+    """Default response class: orjson when installed, stdlib json otherwise.
+
+    OPT_NON_STR_KEYS keeps {user_id: status} maps working like json.dumps did.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+# Column order of a message row; select these, then serialize_message(row)
+MESSAGE_COLUMNS = (
+    Message.id,
+    Message.chat_id,
+    Message.sender_id,
+    User.name.label("sender_name"),
+    Message.content,
+    Message.created_at,
+    Message.message_type,
+    Message.is_edited,
+)
+
+
+def select_messages():
+    """SELECT of MESSAGE_COLUMNS with the sender joined; add WHERE / ORDER BY"""
+    return select(*MESSAGE_COLUMNS).join(User, User.id == Message.sender_id)
+
+
+def message_row(message: Message, sender_name: str) -> tuple:
+    """An ORM message as a MESSAGE_COLUMNS row (write paths)"""
+    return (
+        message.id, message.chat_id, message.sender_id, sender_name,
+        message.content, message.created_at, message.message_type, message.is_edited,
+    )
+
+
+def serialize_message(row: Sequence, read: bool) -> dict:
+    message_id, chat_id, sender_id, sender_name, content, created_at, message_type, is_edited = row
+    return {
+        "id": message_id,
+        "chatId": chat_id,
+        "senderId": sender_id,
+        "senderName": sender_name,
+        "text": content,
+        "time": created_at.isoformat() if created_at else None,
+        "type": message_type,
+        "isRead": read,
+        "isEdited": bool(is_edited)
+    }
+
+
+def serialize_messages(rows: Iterable[Sequence], viewer_id: int, marks: Tuple[int, int]) -> List[dict]:
+    """A page of messages; isRead from the chat's read watermarks"""
+    # row[0] - id, row[2] - sender_id (MESSAGE_COLUMNS order)
+    return [serialize_message(row, is_read(row[0], row[2], viewer_id, marks)) for row in rows]
+
+
+def serialize_chat_list_item(row, user_id: int) -> dict:
+    """One row of services.chat_list.get_chat_list's query"""
+    if row.is_group:
+        name, avatar_url = row.name, row.avatar_url
+    else:
+        name = row.peer_name or "Unknown"
+        avatar_url = row.peer_avatar_url
+
+    last_time = row.last_time or row.created_at
+    return {
+        "id": row.id,
+        "name": name,
+        "is_group": row.is_group,
+        "avatarUrl": avatar_url,
+        "lastMessage": {
+            "text": row.last_text,
+            "time": last_time.isoformat() if last_time else None,
+            "senderId": row.last_sender_id,
+            "isRead": is_read(
+                row.last_message_id, row.last_sender_id, user_id,
+                (row.last_read_message_id or 0, row.peers_read_message_id or 0)
+            ) if row.last_message_id else True
+        },
+        "unreadCount": row.unread_count,
+        "isPinned": row.is_pinned,
+        "isMuted": row.is_muted,
+        "userId": None if row.is_group else row.peer_id,  # For frontend compatibility
+        "type": "group" if row.is_group else "private"
+    }
+
+
+def serialize_chat(chat, participants: Iterable) -> dict:
+    """Chat with its participants, as returned by create_chat"""
+    return {
+        "id": chat.id,
+        "name": chat.name,
+        "is_group": chat.is_group,
+        "avatar_url": chat.avatar_url,
+        "created_at": chat.created_at.isoformat() if chat.created_at else None,
+        "updated_at": chat.updated_at.isoformat() if chat.updated_at else None,
+        "participants": [
+            {
+                "user_id": p.user_id,
+                "is_pinned": p.is_pinned,
+                "is_muted": p.is_muted,
+                "unread_count": p.unread_count
+            } for p in participants
+        ]
+    }
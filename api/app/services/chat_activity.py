@@ -0,0 +1,75 @@
+# app/services/chat_activity.py
+from sqlalchemy import desc, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.chat import Chat
+from app.models.message import Message
+
+PREVIEW_LENGTH = 200
+
+
+def make_preview(content: str) -> str:
+    """Truncate message content to fit Chat.last_message_preview"""
+    if content is None:
+        return None
+    return content[:PREVIEW_LENGTH]
+
+
+async def record_new_message(db: AsyncSession, message: Message):
+    """Point the chat at a freshly flushed message.
+
+    Runs as one UPDATE inside the caller's transaction, so the pointer
+    commits (or rolls back) together with the message row.
+    """
+    created_at = select(Message.created_at).where(
+        Message.id == message.id
+    ).scalar_subquery()
+
+    await db.execute(
+        update(Chat).where(
+            Chat.id == message.chat_id,
+            (Chat.last_message_id == None) | (Chat.last_message_id < message.id)
+        ).values(
+            last_message_id=message.id,
+            last_message_preview=make_preview(message.content),
+            last_activity_at=created_at,
+            updated_at=func.now()
+        ).execution_options(synchronize_session=False)
+    )
+
+
+async def record_edited_message(db: AsyncSession, message: Message):
+    """Refresh the preview if the edited message is the chat's last one"""
+    await db.execute(
+        update(Chat).where(
+            Chat.id == message.chat_id,
+            Chat.last_message_id == message.id
+        ).values(
+            last_message_preview=make_preview(message.content)
+        ).execution_options(synchronize_session=False)
+    )
+
+
+async def record_deleted_message(db: AsyncSession, chat_id: int, message_id: int):
+    """Move the pointer back to the previous message after a delete.
+
+    Must be called after the delete has been flushed.
+    """
+    last_message_id = await db.scalar(
+        select(Chat.last_message_id).where(Chat.id == chat_id)
+    )
+    if last_message_id != message_id:
+        return
+
+    previous = (await db.execute(
+        select(Message.id, Message.content, Message.created_at).where(
+            Message.chat_id == chat_id
+        ).order_by(desc(Message.created_at), desc(Message.id)).limit(1)
+    )).first()
+
+    await db.execute(
+        update(Chat).where(Chat.id == chat_id).values(
+            last_message_id=previous.id if previous else None,
+            last_message_preview=make_preview(previous.content) if previous else None,
+            last_activity_at=previous.created_at if previous else Chat.created_at
+        ).execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,68 @@
+# app/services/chat_list.py
+from sqlalchemy import and_, desc, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from app.models.user import User
+from app.models.chat import Chat, ChatParticipant
+from app.models.message import Message
+from app.serializers import serialize_chat_list_item
+from app.services.read_state import unread_count_subquery
+
+
+async def get_chat_list(db: AsyncSession, user_id: int, offset: int = 0, limit: int = 50) -> list:
+    """One page of the user's chat list, ordered and paginated in SQL.
+
+    Preview and ordering come from the denormalized Chat.last_* columns,
+    so the cost does not depend on how many messages a chat holds.
+    """
+    # For private chats the peer is the other participant
+    peer = aliased(ChatParticipant)
+    peer_id = select(func.min(peer.user_id)).where(
+        and_(peer.chat_id == Chat.id, peer.user_id != user_id)
+    ).correlate(Chat).scalar_subquery()
+    peer_user = aliased(User)
+
+    activity_at = func.coalesce(Chat.last_activity_at, Chat.created_at)
+
+    unread_count = unread_count_subquery(
+        ChatParticipant.chat_id, ChatParticipant.user_id, ChatParticipant.last_read_message_id
+    ).correlate(ChatParticipant)
+    # Furthest any other member has read - decides isRead of our own last message
+    reader = aliased(ChatParticipant)
+    peers_read = select(func.max(reader.last_read_message_id)).where(
+        and_(reader.chat_id == Chat.id, reader.user_id != user_id)
+    ).correlate(Chat).scalar_subquery()
+
+    rows = (await db.execute(select(
+        Chat.id,
+        Chat.name,
+        Chat.is_group,
+        Chat.avatar_url,
+        Chat.created_at,
+        unread_count.label("unread_count"),
+        ChatParticipant.last_read_message_id,
+        peers_read.label("peers_read_message_id"),
+        Chat.last_message_id,
+        ChatParticipant.is_pinned,
+        ChatParticipant.is_muted,
+        Chat.last_message_preview.label("last_text"),
+        Chat.last_activity_at.label("last_time"),
+        Message.sender_id.label("last_sender_id"),
+        peer_user.id.label("peer_id"),
+        peer_user.name.label("peer_name"),
+        peer_user.avatar_url.label("peer_avatar_url"),
+    ).select_from(ChatParticipant).join(
+        Chat, Chat.id == ChatParticipant.chat_id
+    ).outerjoin(
+        Message, Message.id == Chat.last_message_id
+    ).outerjoin(
+        peer_user, and_(Chat.is_group == False, peer_user.id == peer_id)
+    ).where(
+        ChatParticipant.user_id == user_id
+    ).order_by(
+        desc(func.coalesce(ChatParticipant.is_pinned, False)),
+        desc(activity_at),
+        desc(Chat.id)
+    ).offset(offset).limit(limit))).all()
+
+    return [serialize_chat_list_item(row, user_id) for row in rows]
@@ -0,0 +1,33 @@
+# app/services/direct_chats.py
+# Личные чаты ищутся по каноническому ключу пары (dm_user_low, dm_user_high)
+# с уникальным индексом - один индексный запрос вместо перебора всех чатов.
+from typing import Optional, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.chat import Chat
+
+
+def dm_pair(user_a: int, user_b: int) -> Tuple[int, int]:
+    return min(user_a, user_b), max(user_a, user_b)
+
+
+async def find_direct_chat(db: AsyncSession, user_a: int, user_b: int) -> Optional[Chat]:
+    low, high = dm_pair(user_a, user_b)
+    return await db.scalar(select(Chat).where(
+        Chat.dm_user_low == low,
+        Chat.dm_user_high == high
+    ))
+
+
+async def release_pair(db: AsyncSession, chat_id: int):
+    """Drop the pair key once the chat no longer has both participants.
+
+    The next "open DM" between the two then creates a fresh chat, as it did
+    before the key existed. The caller commits.
+    """
+    await db.execute(
+        update(Chat).where(
+            Chat.id == chat_id,
+            Chat.dm_user_low != None
+        ).values(dm_user_low=None, dm_user_high=None).execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,60 @@
+# app/services/message_dedupe.py
+# Кэш недавних отправок по (sender_id, clientMessageId): повторы после сбоя сети
+# получают исходное сообщение, не доходя до БД. Источник истины - уникальный
+# индекс ix_messages_sender_client_id, кэш только срезает всплески повторов.
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+from app.config import settings
+from app.models.message import Message
+
+
+class MessageDedupeCache:
+    """TTL + LRU map (sender_id, client_message_id) -> sent Message, plus per-key locks"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[int, str], tuple]" = OrderedDict()
+        # in-flight sends: concurrent duplicates wait for the first one instead of racing it
+        self._locks: Dict[Tuple[int, str], asyncio.Lock] = {}
+        self._waiters: Dict[Tuple[int, str], int] = {}
+        self.hits = 0
+
+    def get(self, sender_id: int, client_message_id: str) -> Optional[Message]:
+        key = (sender_id, client_message_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, sender_id: int, client_message_id: str, message: Message):
+        key = (sender_id, client_message_id)
+        self._entries[key] = (time.monotonic() + self.ttl, message)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    @asynccontextmanager
+    async def claim(self, sender_id: int, client_message_id: str):
+        key = (sender_id, client_message_id)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+# global instance
+message_dedupe = MessageDedupeCache(settings.MESSAGE_DEDUPE_TTL, settings.MESSAGE_DEDUPE_MAX_SIZE)
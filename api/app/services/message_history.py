@@ -0,0 +1,81 @@
+# app/services/message_history.py
+import base64
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, status
+from sqlalchemy import desc, asc, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.message import Message
+from app.serializers import select_messages
+
+
+def encode_cursor(message) -> str:
+    """Opaque cursor for a message position: (created_at, id); takes a Message or a row"""
+    raw = f"{message.created_at.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, message_id = base64.urlsafe_b64decode(padded).decode().rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+async def get_message_page(
+    db: AsyncSession,
+    chat_id: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = 50
+) -> dict:
+    """Keyset page of chat history over (chat_id, created_at, id).
+
+    `before` walks to older messages, `after` to newer ones; without either
+    the newest page is returned. Messages are MESSAGE_COLUMNS rows
+    (app/serializers.py) in chronological order.
+    next_cursor points further back in history, prev_cursor towards the
+    present (None when there is nothing more in that direction).
+    """
+    if before and after:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either before or after, not both"
+        )
+
+    position = tuple_(Message.created_at, Message.id)
+    query = select_messages().where(Message.chat_id == chat_id)
+
+    if after:
+        query = query.where(position > tuple_(*decode_cursor(after))).order_by(
+            asc(Message.created_at), asc(Message.id)
+        )
+    else:
+        if before:
+            query = query.where(position < tuple_(*decode_cursor(before)))
+        query = query.order_by(desc(Message.created_at), desc(Message.id))
+
+    # One extra row tells whether another page exists in this direction
+    rows = list((await db.execute(query.limit(limit + 1))).all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if not after:
+        rows.reverse()
+
+    if not rows:
+        return {"messages": [], "next_cursor": None, "prev_cursor": None}
+
+    if after:
+        next_cursor = encode_cursor(rows[0])
+        prev_cursor = encode_cursor(rows[-1]) if has_more else None
+    else:
+        next_cursor = encode_cursor(rows[0]) if has_more else None
+        prev_cursor = encode_cursor(rows[-1]) if before else None
+
+    return {"messages": rows, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
@@ -0,0 +1,307 @@
+# app/services/message_import.py
+# Массовая загрузка сообщений из NDJSON: миграция истории, повтор трафика ботов.
+# Пачками: вставка одним COPY (PostgreSQL + asyncpg) или executemany, затем
+# по одному UPDATE на указатели чатов и водяные знаки за пачку, один commit.
+#
+# Строка: {"chatId": 1, "senderId": 2, "text": "hi", "type": "text",
+#          "time": "2024-01-01T10:00:00Z", "clientMessageId": "legacy-42"}
+# time и clientMessageId необязательны; с clientMessageId повторный прогон
+# того же файла пропускает уже загруженные строки.
+import json
+import logging
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Set, Tuple
+from pydantic import ValidationError
+from sqlalchemy import bindparam, desc, func, insert, select, text, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.chat import Chat, ChatParticipant
+from app.models.message import Message
+from app.models.user import User
+from app.schemas.message import MessageImportRecord
+from app.services.chat_activity import PREVIEW_LENGTH
+from app.services.read_state import newest_message_id
+from app.services.message_write import new_message_payload
+from app.websocket_manager import manager
+
+logger = logging.getLogger(__name__)
+
+# the report keeps only the first errors; counters are always exact
+MAX_REPORTED_ERRORS = 100
+
+COPY_COLUMNS = [
+    "id", "chat_id", "sender_id", "content", "message_type",
+    "is_edited", "created_at", "client_message_id"
+]
+
+
+class ImportReport:
+    """Counters of one import run"""
+
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.skipped = 0  # already imported (same senderId + clientMessageId)
+        self.failed = 0
+        self.batches = 0
+        self.errors: List[dict] = []
+
+    def error(self, line: int, detail: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "detail": detail})
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "errors": self.errors
+        }
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """(line number, line) from a byte stream split at arbitrary points"""
+    buffer = b""
+    line_no = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield line_no, line
+    if buffer.strip():
+        yield line_no + 1, buffer
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+async def import_messages(
+    db: AsyncSession,
+    chunks: AsyncIterator[bytes],
+    batch_size: int = 5000,
+    broadcast: bool = False,
+    mark_read: bool = False
+) -> ImportReport:
+    """Load an NDJSON message stream; every batch commits on its own.
+
+    broadcast - send new_message frames to online participants (one backplane
+    round trip per batch); mark_read - move every participant's watermark to
+    the chat's highest message id, for history that nobody should see as unread.
+    """
+    report = ImportReport()
+    batch: List[Tuple[int, MessageImportRecord]] = []
+
+    async for line_no, line in iter_ndjson_lines(chunks):
+        report.received += 1
+        try:
+            batch.append((line_no, MessageImportRecord.model_validate_json(line)))
+        except ValidationError as e:
+            report.error(line_no, "; ".join(
+                f"{'.'.join(map(str, err['loc'])) or 'line'}: {err['msg']}" for err in e.errors()
+            ))
+            continue
+        if len(batch) >= batch_size:
+            await _import_batch(db, batch, report, broadcast, mark_read)
+            batch = []
+
+    if batch:
+        await _import_batch(db, batch, report, broadcast, mark_read)
+    return report
+
+
+async def _import_batch(
+    db: AsyncSession,
+    batch: List[Tuple[int, MessageImportRecord]],
+    report: ImportReport,
+    broadcast: bool,
+    mark_read: bool
+):
+    report.batches += 1
+    # on failure the whole batch is reported once, not on top of per-line rejects
+    snapshot = (report.failed, report.skipped, len(report.errors))
+    try:
+        rows, members = await _accepted_rows(db, batch, report)
+        if rows:
+            await _insert_rows(db, rows)
+            chat_ids = list({row["chat_id"] for row in rows})
+            await _update_chat_pointers(db, chat_ids)
+            await _update_watermarks(db, rows, chat_ids, mark_read)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Import batch failed: {e}")
+        report.failed, report.skipped = snapshot[0], snapshot[1]
+        del report.errors[snapshot[2]:]
+        for line_no, _ in batch:
+            report.error(line_no, f"Batch failed: {e}")
+        return
+
+    report.inserted += len(rows)
+    if broadcast and rows:
+        await _broadcast(db, rows, members)
+
+
+async def _accepted_rows(
+    db: AsyncSession,
+    batch: List[Tuple[int, MessageImportRecord]],
+    report: ImportReport
+) -> Tuple[List[dict], Dict[int, List[int]]]:
+    """Rows that pass the membership and duplicate checks - two queries per batch"""
+    chat_ids = {record.chat_id for _, record in batch}
+    members: Dict[int, List[int]] = {}
+    for chat_id, user_id in await db.execute(
+        select(ChatParticipant.chat_id, ChatParticipant.user_id).where(
+            ChatParticipant.chat_id.in_(chat_ids)
+        )
+    ):
+        members.setdefault(chat_id, []).append(user_id)
+
+    keys = {(r.sender_id, r.client_message_id) for _, r in batch if r.client_message_id}
+    seen: Set[Tuple[int, str]] = set()
+    if keys:
+        seen = set((await db.execute(
+            select(Message.sender_id, Message.client_message_id).where(
+                tuple_(Message.sender_id, Message.client_message_id).in_(keys)
+            )
+        )).all())
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    for line_no, record in batch:
+        if record.sender_id not in members.get(record.chat_id, ()):
+            report.error(line_no, "Sender is not a participant of this chat")
+            continue
+        if record.client_message_id:
+            key = (record.sender_id, record.client_message_id)
+            if key in seen:
+                report.skipped += 1
+                continue
+            seen.add(key)
+        rows.append({
+            "chat_id": record.chat_id,
+            "sender_id": record.sender_id,
+            "content": record.content,
+            "message_type": record.message_type,
+            "is_edited": False,
+            "created_at": _as_utc(record.created_at) if record.created_at else now,
+            "client_message_id": record.client_message_id
+        })
+
+    # ids follow time order inside a batch, like live traffic
+    rows.sort(key=lambda row: row["created_at"])
+    return rows, members
+
+
+async def _insert_rows(db: AsyncSession, rows: List[dict]):
+    """Fill row["id"]: COPY with pre-allocated ids on asyncpg, executemany elsewhere"""
+    dialect = db.bind.dialect
+    if dialect.name == "postgresql" and dialect.driver == "asyncpg":
+        ids = sorted((await db.scalars(
+            text("SELECT nextval(pg_get_serial_sequence('messages', 'id')) FROM generate_series(1, :n)"),
+            {"n": len(rows)}
+        )).all())
+        for row, message_id in zip(rows, ids):
+            row["id"] = message_id
+
+        connection = await db.connection()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            "messages",
+            records=[tuple(row[column] for column in COPY_COLUMNS) for row in rows],
+            columns=COPY_COLUMNS
+        )
+        return
+
+    # SQLAlchemy batches this into multi-row INSERT ... RETURNING (insertmanyvalues)
+    ids = await db.scalars(
+        insert(Message).returning(Message.id, sort_by_parameter_order=True), rows
+    )
+    for row, message_id in zip(rows, ids):
+        row["id"] = message_id
+
+
+async def _update_chat_pointers(db: AsyncSession, chat_ids: List[int]):
+    """Point each touched chat at its newest message - once per chat per batch.
+
+    Imported history may be older than what the chat already has, so the
+    newest row is looked up by (created_at, id) rather than taken from the batch.
+    """
+    newest = select(Message.id).where(
+        Message.chat_id == Chat.id
+    ).order_by(desc(Message.created_at), desc(Message.id)).limit(1).scalar_subquery()
+
+    await db.execute(
+        update(Chat).where(Chat.id.in_(chat_ids)).values(
+            last_message_id=newest
+        ).execution_options(synchronize_session=False)
+    )
+
+    # второй проход: превью и время берутся у только что выставленного указателя
+    await db.execute(
+        update(Chat).where(Chat.id.in_(chat_ids)).values(
+            last_message_preview=select(func.substr(Message.content, 1, PREVIEW_LENGTH)).where(
+                Message.id == Chat.last_message_id
+            ).scalar_subquery(),
+            last_activity_at=select(Message.created_at).where(
+                Message.id == Chat.last_message_id
+            ).scalar_subquery(),
+            updated_at=func.now()
+        ).execution_options(synchronize_session=False)
+    )
+
+
+async def _update_watermarks(db: AsyncSession, rows: List[dict], chat_ids: List[int], mark_read: bool):
+    participants = ChatParticipant.__table__
+
+    if mark_read:
+        target = newest_message_id(participants.c.chat_id)
+        await db.execute(
+            participants.update().where(
+                participants.c.chat_id.in_(chat_ids),
+                func.coalesce(participants.c.last_read_message_id, 0) < func.coalesce(target, 0)
+            ).values(last_read_message_id=target)
+        )
+        return
+
+    # a sender has read their chat up to their own newest message (as in create_message)
+    marks: Dict[Tuple[int, int], int] = {}
+    for row in rows:
+        key = (row["chat_id"], row["sender_id"])
+        marks[key] = max(marks.get(key, 0), row["id"])
+
+    await db.execute(
+        participants.update().where(
+            participants.c.chat_id == bindparam("b_chat"),
+            participants.c.user_id == bindparam("b_user"),
+            func.coalesce(participants.c.last_read_message_id, 0) < bindparam("b_mark")
+        ).values(last_read_message_id=bindparam("b_mark")),
+        [{"b_chat": chat_id, "b_user": user_id, "b_mark": mark} for (chat_id, user_id), mark in marks.items()]
+    )
+
+
+async def _broadcast(db: AsyncSession, rows: List[dict], members: Dict[int, List[int]]):
+    sender_ids = {row["sender_id"] for row in rows}
+    names = dict((await db.execute(
+        select(User.id, User.name).where(User.id.in_(sender_ids))
+    )).all())
+
+    frames = []
+    for row in rows:
+        frame = json.dumps({
+            "type": "new_message",
+            "message": new_message_payload(Message(**row), names.get(row["sender_id"]))
+        })
+        frames.extend((user_id, frame) for user_id in members[row["chat_id"]])
+
+    try:
+        await manager.send_personal_messages(frames)
+    except Exception as e:
+        # the rows are committed; live delivery is best effort
+        logger.error(f"Import broadcast failed: {e}")
@@ -0,0 +1,258 @@
+# app/services/message_search.py
+# Полнотекстовый поиск по сообщениям: SQLite FTS5 или PostgreSQL tsvector+GIN.
+# Индекс синхронизируется самой БД (триггеры / generated column), поэтому
+# вставки, правки и удаления любым путем - ORM, bulk, миграции - его не обходят.
+import base64
+import html
+import re
+from typing import List, Optional
+from fastapi import HTTPException, status
+from sqlalchemy import Boolean, DateTime, Float, Integer, String, Text, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.serializers import serialize_message
+from app.services.read_state import is_read
+
+# PostgreSQL text search configuration; 'simple' - без стемминга, язык сообщений смешанный
+TS_CONFIG = "simple"
+
+# snippet markers: control chars survive html.escape and are swapped for <mark> afterwards
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, content='messages', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+]
+
+POSTGRES_DDL = [
+    f"""
+    ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('{TS_CONFIG}', coalesce(content, ''))) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING GIN (search_vector)",
+]
+
+
+def install_search_index(connection):
+    """Create the FTS structures if missing (sync connection; idempotent)"""
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        existed = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        )).first() is not None
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+        if not existed:
+            # index messages written before the FTS table existed
+            connection.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+    elif dialect == "postgresql":
+        for statement in POSTGRES_DDL:
+            connection.execute(text(statement))
+
+
+def drop_search_index(connection):
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        for trigger in ("messages_fts_ai", "messages_fts_ad", "messages_fts_au"):
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        connection.execute(text("DROP TABLE IF EXISTS messages_fts"))
+    elif dialect == "postgresql":
+        connection.execute(text("DROP INDEX IF EXISTS ix_messages_search_vector"))
+        connection.execute(text("ALTER TABLE messages DROP COLUMN IF EXISTS search_vector"))
+
+
+def _tokens(q: str) -> List[str]:
+    # only word characters reach the FTS syntax - no operators from user input
+    return re.findall(r"\w+", q.lower())
+
+
+def build_match_query(q: str, dialect: str) -> Optional[str]:
+    """All terms must match; the last one is a prefix (search-as-you-type)"""
+    tokens = _tokens(q)
+    if not tokens:
+        return None
+    if dialect == "postgresql":
+        return " & ".join(tokens[:-1] + [tokens[-1] + ":*"])
+    return " ".join(f'"{t}"' for t in tokens[:-1]) + f' "{tokens[-1]}"*'
+
+
+def encode_search_cursor(score: float, message_id: int) -> str:
+    raw = f"{score!r}|{message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, message_id = base64.urlsafe_b64decode(padded).decode().rsplit("|", 1)
+        return float(score), int(message_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def _render_snippet(snippet: Optional[str]) -> Optional[str]:
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+_COLUMNS = """
+    m.id AS id, m.chat_id AS chat_id, m.sender_id AS sender_id, u.name AS sender_name,
+    m.content AS content, m.created_at AS created_at, m.message_type AS message_type,
+    m.is_edited AS is_edited
+"""
+
+# score: lower is better on every dialect, ties broken by newer id first
+_SQLITE_SEARCH = f"""
+    SELECT * FROM (
+        SELECT {_COLUMNS},
+            snippet(messages_fts, 0, :mark_start, :mark_end, '…', 16) AS snippet,
+            bm25(messages_fts) AS score
+        FROM messages_fts
+        JOIN messages m ON m.id = messages_fts.rowid
+        JOIN chat_participants cp ON cp.chat_id = m.chat_id AND cp.user_id = :user_id
+        JOIN users u ON u.id = m.sender_id
+        WHERE messages_fts MATCH :query {{chat_filter}}
+    ) ranked
+    {{cursor_filter}}
+    ORDER BY score, id DESC
+    LIMIT :limit
+"""
+
+_POSTGRES_SEARCH = f"""
+    SELECT ranked.*,
+        ts_headline('{TS_CONFIG}', ranked.content, to_tsquery('{TS_CONFIG}', :query),
+            'StartSel=' || :mark_start || ', StopSel=' || :mark_end || ', MaxFragments=1, MaxWords=24, MinWords=8'
+        ) AS snippet
+    FROM (
+        SELECT * FROM (
+            SELECT {_COLUMNS},
+                -ts_rank_cd(m.search_vector, to_tsquery('{TS_CONFIG}', :query)) AS score
+            FROM messages m
+            JOIN chat_participants cp ON cp.chat_id = m.chat_id AND cp.user_id = :user_id
+            JOIN users u ON u.id = m.sender_id
+            WHERE m.search_vector @@ to_tsquery('{TS_CONFIG}', :query) {{chat_filter}}
+        ) matches
+        {{cursor_filter}}
+        ORDER BY score, id DESC
+        LIMIT :limit
+    ) ranked
+    ORDER BY score, id DESC
+"""
+
+# other dialects: no FTS index, substring match without ranking
+_FALLBACK_SEARCH = f"""
+    SELECT * FROM (
+        SELECT {_COLUMNS}, NULL AS snippet, 0.0 AS score
+        FROM messages m
+        JOIN chat_participants cp ON cp.chat_id = m.chat_id AND cp.user_id = :user_id
+        JOIN users u ON u.id = m.sender_id
+        WHERE lower(m.content) LIKE :query {{chat_filter}}
+    ) ranked
+    {{cursor_filter}}
+    ORDER BY score, id DESC
+    LIMIT :limit
+"""
+
+
+async def search_messages(
+    db: AsyncSession,
+    user_id: int,
+    q: str,
+    chat_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = 20
+) -> dict:
+    """Ranked full-text search over the chats `user_id` belongs to.
+
+    Returns {"messages": [row dicts with snippet], "next_cursor"}; the
+    cursor is (score, id), so pages stay stable while scrolling.
+    """
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        template, query = _SQLITE_SEARCH, build_match_query(q, dialect)
+    elif dialect == "postgresql":
+        template, query = _POSTGRES_SEARCH, build_match_query(q, dialect)
+    else:
+        template, query = _FALLBACK_SEARCH, f"%{q.lower()}%"
+
+    if not query:
+        return {"messages": [], "next_cursor": None}
+
+    params = {
+        "user_id": user_id,
+        "query": query,
+        "limit": limit + 1,
+        "mark_start": _MARK_START,
+        "mark_end": _MARK_END,
+    }
+
+    chat_filter = ""
+    if chat_id is not None:
+        chat_filter = "AND m.chat_id = :chat_id"
+        params["chat_id"] = chat_id
+
+    cursor_filter = ""
+    if cursor:
+        params["cursor_score"], params["cursor_id"] = decode_search_cursor(cursor)
+        cursor_filter = (
+            "WHERE score > :cursor_score OR (score = :cursor_score AND id < :cursor_id)"
+        )
+
+    statement = text(
+        template.format(chat_filter=chat_filter, cursor_filter=cursor_filter)
+    ).columns(
+        id=Integer, chat_id=Integer, sender_id=Integer, sender_name=String,
+        content=Text, created_at=DateTime(timezone=True), message_type=String,
+        is_edited=Boolean, snippet=Text, score=Float
+    )
+    rows = (await db.execute(statement, params)).mappings().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_search_cursor(rows[-1]["score"], rows[-1]["id"])
+
+    messages = []
+    for row in rows:
+        message = dict(row)
+        message["snippet"] = _render_snippet(row["snippet"])
+        messages.append(message)
+
+    return {"messages": messages, "next_cursor": next_cursor}
+
+
+def to_frontend(row: dict, viewer_id: Optional[int] = None, marks: Optional[tuple] = None) -> dict:
+    """Search row in the frontend message format plus the highlighted snippet.
+
+    isRead needs the chat's read marks, so it is only exact for single-chat search.
+    """
+    message = serialize_message(
+        (row["id"], row["chat_id"], row["sender_id"], row["sender_name"], row["content"],
+         row["created_at"], row["message_type"], row["is_edited"]),
+        is_read(row["id"], row["sender_id"], viewer_id, marks) if marks else True
+    )
+    message["snippet"] = row["snippet"]
+    return message
@@ -0,0 +1,235 @@
+# app/services/message_write.py
+# Запись сообщений, общая для REST-роутеров и WebSocket-команд:
+# проверки доступа, счетчики, указатель на последнее сообщение и рассылка.
+from datetime import datetime
+from typing import List, Optional
+from fastapi import HTTPException, status
+from sqlalchemy import and_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.chat import ChatParticipant
+from app.models.message import Message
+from app.models.user import User
+from app.serializers import message_row, serialize_message
+from app.services import read_state
+from app.services.message_dedupe import message_dedupe
+from app.services.chat_activity import record_new_message, record_edited_message, record_deleted_message
+from app.websocket_manager import manager
+
+
+async def require_participant(db: AsyncSession, chat_id: int, user_id: int) -> ChatParticipant:
+    participant = await db.scalar(select(ChatParticipant).where(
+        and_(
+            ChatParticipant.chat_id == chat_id,
+            ChatParticipant.user_id == user_id
+        )
+    ))
+
+    if not participant:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not a participant of this chat"
+        )
+    return participant
+
+
+async def get_participant_ids(db: AsyncSession, chat_id: int) -> List[int]:
+    return list(await db.scalars(select(ChatParticipant.user_id).where(
+        ChatParticipant.chat_id == chat_id
+    )))
+
+
+async def get_own_message(db: AsyncSession, message_id: int, user_id: int, action: str) -> Message:
+    message = await db.scalar(select(Message).where(Message.id == message_id))
+
+    if not message:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Message not found"
+        )
+
+    if message.sender_id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Can only {action} your own messages"
+        )
+    return message
+
+
+def new_message_payload(message: Message, sender_name: str) -> dict:
+    return serialize_message(message_row(message, sender_name), False)
+
+
+async def create_message(
+    db: AsyncSession,
+    sender: User,
+    chat_id: int,
+    content: str,
+    message_type: str = "text",
+    client_message_id: Optional[str] = None
+) -> Message:
+    """Store a message, bump counters and notify chat participants.
+
+    With client_message_id the send is idempotent per sender: a retry gets
+    the original message back, without a second write or broadcast.
+    """
+    if client_message_id is None:
+        return await _insert_message(db, sender, chat_id, content, message_type)
+
+    # plain int: a rollback on the duplicate path expires ORM instances
+    sender_id = sender.id
+    async with message_dedupe.claim(sender_id, client_message_id):
+        message = message_dedupe.get(sender_id, client_message_id)
+        if message is None:
+            message = await _find_by_client_id(db, sender_id, client_message_id)
+        if message is None:
+            message = await _insert_message(db, sender, chat_id, content, message_type, client_message_id)
+
+        if message.chat_id != chat_id:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="clientMessageId already used in another chat"
+            )
+        message_dedupe.put(sender_id, client_message_id, message)
+        return message
+
+
+async def _find_by_client_id(db: AsyncSession, sender_id: int, client_message_id: str) -> Optional[Message]:
+    return await db.scalar(select(Message).where(
+        Message.sender_id == sender_id,
+        Message.client_message_id == client_message_id
+    ))
+
+
+async def _insert_message(
+    db: AsyncSession,
+    sender: User,
+    chat_id: int,
+    content: str,
+    message_type: str,
+    client_message_id: Optional[str] = None
+) -> Message:
+    sender_id = sender.id
+    await require_participant(db, chat_id, sender_id)
+
+    message = Message(
+        chat_id=chat_id,
+        sender_id=sender_id,
+        content=content,
+        message_type=message_type,
+        client_message_id=client_message_id
+    )
+
+    db.add(message)
+    try:
+        await db.flush()  # Get message.id
+    except IntegrityError:
+        if client_message_id is None:
+            raise
+        # Same retry landed on another worker first - its row is the answer.
+        # Not a SAVEPOINT: pysqlite commits on RELEASE of an outermost savepoint,
+        # which would split the message from its pointer update. The rollback
+        # expires the caller's ORM objects, so callers read what they need first.
+        await db.rollback()
+        existing = await _find_by_client_id(db, sender_id, client_message_id)
+        if existing is None:
+            raise
+        return existing
+
+    # O(1) per message: only the sender's watermark moves, unread counts
+    # of the other members are derived from it (see read_state)
+    await read_state.mark_read(db, chat_id, sender_id, message.id)
+    participant_ids = await get_participant_ids(db, chat_id)
+
+    # Last-message pointer commits together with the message
+    await record_new_message(db, message)
+
+    await db.commit()
+    await db.refresh(message)
+
+    await manager.send_to_chat({
+        "type": "new_message",
+        "message": new_message_payload(message, sender.name)
+    }, participant_ids)
+
+    return message
+
+
+async def edit_message(db: AsyncSession, user: User, message_id: int, content: str) -> Message:
+    message = await get_own_message(db, message_id, user.id, "edit")
+
+    message.content = content
+    message.is_edited = True
+    message.edited_at = datetime.utcnow()
+    await record_edited_message(db, message)
+
+    await db.commit()
+    await db.refresh(message)
+
+    await manager.send_to_chat({
+        "type": "message_edited",
+        "message": {
+            "id": message.id,
+            "chatId": message.chat_id,
+            "text": message.content,
+            "isEdited": True,
+            "editedAt": message.edited_at.isoformat()
+        }
+    }, await get_participant_ids(db, message.chat_id))
+
+    return message
+
+
+async def delete_message(db: AsyncSession, user: User, message_id: int) -> int:
+    """Delete own message; returns its chat id"""
+    message = await get_own_message(db, message_id, user.id, "delete")
+    chat_id = message.chat_id
+
+    await db.delete(message)
+    await db.flush()
+    await record_deleted_message(db, chat_id, message_id)
+    await db.commit()
+
+    await manager.send_to_chat({
+        "type": "message_deleted",
+        "message": {
+            "id": message_id,
+            "chatId": chat_id
+        }
+    }, await get_participant_ids(db, chat_id))
+
+    return chat_id
+
+
+async def advance_read(db: AsyncSession, user: User, chat_id: int, message_id: Optional[int] = None):
+    """Move the reader's watermark and tell the chat (read receipts)"""
+    if not await read_state.mark_read(db, chat_id, user.id, message_id):
+        return
+    await db.commit()
+
+    watermark = await db.scalar(select(ChatParticipant.last_read_message_id).where(
+        ChatParticipant.chat_id == chat_id,
+        ChatParticipant.user_id == user.id
+    ))
+    await manager.send_to_chat({
+        "type": "messages_read",
+        "chatId": chat_id,
+        "userId": user.id,
+        "lastReadMessageId": watermark
+    }, await get_participant_ids(db, chat_id))
+
+
+async def mark_chat_read(db: AsyncSession, user: User, chat_id: int, message_id: Optional[int] = None):
+    await require_participant(db, chat_id, user.id)
+
+    # a watermark from another chat could mark future messages as read
+    if message_id is not None and not await db.scalar(select(Message.id).where(
+        Message.id == message_id,
+        Message.chat_id == chat_id
+    )):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Message not found"
+        )
+
+    await advance_read(db, user, chat_id, message_id)
@@ -0,0 +1,19 @@
+# app/services/presence.py
+from typing import List
+from sqlalchemy import select, union
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.chat import ChatParticipant, Contact
+
+
+async def get_presence_audience(db: AsyncSession, user_id: int) -> List[int]:
+    """Users interested in user_id's status: chat peers and users who have them as a contact"""
+    my_chats = select(ChatParticipant.chat_id).where(ChatParticipant.user_id == user_id)
+
+    chat_peers = select(ChatParticipant.user_id).where(
+        ChatParticipant.chat_id.in_(my_chats),
+        ChatParticipant.user_id != user_id
+    )
+    watchers = select(Contact.user_id).where(Contact.contact_user_id == user_id)
+
+    # UNION removes duplicates (peer who is also a watcher)
+    return list((await db.scalars(union(chat_peers, watchers))).all())
@@ -0,0 +1,69 @@
+# app/services/read_state.py
+# Прочитанность через "водяной знак": участник хранит id последнего
+# прочитанного сообщения, счетчики и isRead выводятся из него.
+from typing import Optional, Tuple
+from sqlalchemy import case, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.chat import ChatParticipant
+from app.models.message import Message
+
+
+def unread_count_subquery(chat_id, user_id, last_read_message_id):
+    """Messages from others above the watermark; a range scan on (chat_id, id)"""
+    return select(func.count(Message.id)).where(
+        Message.chat_id == chat_id,
+        Message.id > func.coalesce(last_read_message_id, 0),
+        Message.sender_id != user_id
+    ).scalar_subquery()
+
+
+def newest_message_id(chat_id):
+    """Highest message id of a chat - the mark-read-all target; one seek on (chat_id, id)"""
+    return select(func.max(Message.id)).where(Message.chat_id == chat_id).scalar_subquery()
+
+
+async def mark_read(
+    db: AsyncSession,
+    chat_id: int,
+    user_id: int,
+    message_id: Optional[int] = None
+) -> bool:
+    """Move the watermark forward (never back); True if it moved.
+
+    Without message_id the whole chat is marked read: the watermark goes to
+    the chat's highest message id. Chat.last_message_id is not used here - it
+    follows created_at, and back-dated imports get ids above it.
+    The caller commits.
+    """
+    target = message_id if message_id is not None else newest_message_id(chat_id)
+
+    result = await db.execute(
+        update(ChatParticipant).where(
+            ChatParticipant.chat_id == chat_id,
+            ChatParticipant.user_id == user_id,
+            func.coalesce(ChatParticipant.last_read_message_id, 0) < func.coalesce(target, 0)
+        ).values(last_read_message_id=target).execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+async def get_read_marks(db: AsyncSession, chat_id: int, viewer_id: int) -> Tuple[int, int]:
+    """(viewer's watermark, furthest watermark among the other participants)"""
+    own = func.max(case(
+        (ChatParticipant.user_id == viewer_id, ChatParticipant.last_read_message_id)
+    ))
+    peers = func.max(case(
+        (ChatParticipant.user_id != viewer_id, ChatParticipant.last_read_message_id)
+    ))
+    row = (await db.execute(
+        select(own, peers).where(ChatParticipant.chat_id == chat_id)
+    )).one()
+    return row[0] or 0, row[1] or 0
+
+
+def is_read(message_id: int, sender_id: int, viewer_id: int, marks: Tuple[int, int]) -> bool:
+    """Own messages are read once any peer has seen them; others' once the viewer has"""
+    own_mark, peers_mark = marks
+    if sender_id == viewer_id:
+        return peers_mark >= message_id
+    return own_mark >= message_id
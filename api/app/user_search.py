@@ -0,0 +1,165 @@
+# app/user_search.py
+# In-process индекс для поиска пользователей: триграммы по username/name/bio
+# плюс отсортированные списки для быстрого поиска по префиксу.
+import asyncio
+import bisect
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# relevance, higher is better
+SCORE_EXACT = 100
+SCORE_USERNAME_PREFIX = 80
+SCORE_NAME_PREFIX = 60
+SCORE_SUBSTRING = 40
+SCORE_BIO = 10
+CONTACT_BOOST = 25
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class UserSearchIndex:
+    """Trigram postings over all users, rebuilt every USER_SEARCH_REFRESH_INTERVAL.
+
+    Profile changes on this worker are applied immediately via update_user();
+    the periodic rebuild picks up changes made on other workers.
+    """
+
+    def __init__(self):
+        # user_id -> (username, name, bio), lowercased
+        self.users: Dict[int, Tuple[str, str, str]] = {}
+        self.postings: Dict[str, Set[int]] = {}
+        # sorted (value, user_id) for bisect prefix lookups
+        self.by_username: List[Tuple[str, int]] = []
+        self.by_name: List[Tuple[str, int]] = []
+        self.loaded_at: Optional[float] = None
+        self.lock = asyncio.Lock()
+
+    async def ensure_fresh(self, db: AsyncSession):
+        if self._is_fresh():
+            return
+        async with self.lock:
+            if self._is_fresh():
+                return
+            rows = (await db.execute(select(User.id, User.username, User.name, User.bio))).all()
+            self._rebuild(rows)
+            logger.info(f"User search index rebuilt: {len(self.users)} users")
+
+    def _is_fresh(self) -> bool:
+        return self.loaded_at is not None and \
+            time.monotonic() - self.loaded_at < settings.USER_SEARCH_REFRESH_INTERVAL
+
+    def _rebuild(self, rows: Iterable[tuple]):
+        self.users, self.postings = {}, {}
+        for user_id, username, name, bio in rows:
+            self._add(user_id, username, name, bio)
+        self.by_username = sorted((u[0], user_id) for user_id, u in self.users.items())
+        self.by_name = sorted((u[1], user_id) for user_id, u in self.users.items())
+        self.loaded_at = time.monotonic()
+
+    def _add(self, user_id: int, username: str, name: str, bio: Optional[str]):
+        entry = ((username or "").lower(), (name or "").lower(), (bio or "").lower())
+        self.users[user_id] = entry
+        for gram in set().union(*(trigrams(field) for field in entry if field)):
+            self.postings.setdefault(gram, set()).add(user_id)
+
+    def _remove(self, user_id: int):
+        entry = self.users.pop(user_id, None)
+        if entry is None:
+            return
+        for gram in set().union(*(trigrams(field) for field in entry if field)):
+            postings = self.postings.get(gram)
+            if postings:
+                postings.discard(user_id)
+        for sorted_list, value in ((self.by_username, entry[0]), (self.by_name, entry[1])):
+            i = bisect.bisect_left(sorted_list, (value, user_id))
+            if i < len(sorted_list) and sorted_list[i] == (value, user_id):
+                del sorted_list[i]
+
+    def update_user(self, user: User):
+        """Apply a profile change (or a new user) without waiting for a rebuild"""
+        if self.loaded_at is None:
+            return
+        self._remove(user.id)
+        self._add(user.id, user.username, user.name, user.bio)
+        username, name, _ = self.users[user.id]
+        bisect.insort(self.by_username, (username, user.id))
+        bisect.insort(self.by_name, (name, user.id))
+
+    @staticmethod
+    def _prefix_matches(sorted_list: List[Tuple[str, int]], prefix: str, cap: int) -> List[int]:
+        start = bisect.bisect_left(sorted_list, (prefix, -1))
+        matches = []
+        for value, user_id in sorted_list[start:start + cap]:
+            if not value.startswith(prefix):
+                break
+            matches.append(user_id)
+        return matches
+
+    def _score(self, user_id: int, q: str) -> int:
+        username, name, bio = self.users[user_id]
+        if q == username or q == name:
+            return SCORE_EXACT
+        if username.startswith(q):
+            return SCORE_USERNAME_PREFIX
+        if name.startswith(q) or f" {q}" in name:
+            return SCORE_NAME_PREFIX
+        if q in username or q in name:
+            return SCORE_SUBSTRING
+        if q in bio:
+            return SCORE_BIO
+        return 0
+
+    def search(
+        self,
+        q: str,
+        limit: int = 20,
+        exclude_id: Optional[int] = None,
+        contact_ids: Iterable[int] = ()
+    ) -> List[int]:
+        """User ids ranked exact > prefix > substring, contacts boosted"""
+        q = q.strip().lower()
+        if not q:
+            return []
+
+        # Prefix fast path: a bisect into the sorted username / name lists
+        cap = max(limit * 5, 100)
+        candidates = set(self._prefix_matches(self.by_username, q, cap))
+        candidates.update(self._prefix_matches(self.by_name, q, cap))
+
+        # Substring path: every trigram of q occurs in a matching field;
+        # intersect the postings, rarest first. Shorter queries are prefix-only.
+        if len(q) >= 3:
+            grams = sorted((self.postings.get(gram, set()) for gram in trigrams(q)), key=len)
+            if grams:
+                found = set(grams[0])
+                for postings in grams[1:]:
+                    found &= postings
+                    if not found:
+                        break
+                candidates |= found
+
+        contacts = set(contact_ids)
+        scored = []
+        for user_id in candidates:
+            if user_id == exclude_id or user_id not in self.users:
+                continue
+            score = self._score(user_id, q)  # also filters trigram false positives
+            if score:
+                if user_id in contacts:
+                    score += CONTACT_BOOST
+                scored.append((-score, self.users[user_id][0], user_id))
+
+        scored.sort()
+        return [user_id for _, _, user_id in scored[:limit]]
+
+# global instance
+user_search_index = UserSearchIndex()
@@ -1,79 +1,255 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import List, Dict
+from collections import deque
+from typing import List, Dict, Iterable, Optional, Tuple
+import asyncio
 import json
 import logging
+import time
+from app.config import settings
+from app.backplane import BROADCAST_CHANNEL, create_backplane, user_channel
+from app.ws_metrics import WebSocketStats
 
 logger = logging.getLogger(__name__)
 
+# slow consumer policies
+POLICY_DROP = "drop"              # drop the new frame
+POLICY_COALESCE = "coalesce"      # replace pending frame with the same key, else drop the oldest
+POLICY_DISCONNECT = "disconnect"  # close the socket, client reconnects and resyncs
+
+
+class ClientConnection:
+    """One websocket with its own bounded outbound queue and writer task"""
+
+    def __init__(self, websocket: WebSocket, user_id: int, manager: "ConnectionManager"):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.manager = manager
+        self.queue: deque = deque()  # (coalesce_key, payload, enqueued_at)
+        self.has_data = asyncio.Event()
+        self.writer_task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def start(self):
+        self.writer_task = asyncio.create_task(self._writer())
+
+    def enqueue(self, payload: str, coalesce_key: Optional[str] = None) -> bool:
+        """Queue a frame without awaiting the socket; False if it was dropped"""
+        stats = self.manager.stats
+        if self.closed:
+            stats.record_dropped("closed")
+            return False
+
+        policy = settings.WS_SLOW_CONSUMER_POLICY
+
+        if coalesce_key and policy == POLICY_COALESCE:
+            for i, (key, _, enqueued_at) in enumerate(self.queue):
+                if key == coalesce_key:
+                    self.queue[i] = (coalesce_key, payload, enqueued_at)
+                    stats.record_dropped("coalesced")
+                    return True
+
+        if len(self.queue) >= settings.WS_SEND_QUEUE_SIZE:
+            if policy == POLICY_COALESCE:
+                self.queue.popleft()
+                stats.record_dropped("queue_full")
+            elif policy == POLICY_DISCONNECT:
+                logger.warning(f"Disconnecting slow consumer: user {self.user_id}")
+                stats.slow_consumer_disconnects += 1
+                self.close()
+                return False
+            else:
+                logger.debug(f"Dropping frame for slow consumer: user {self.user_id}")
+                stats.record_dropped("queue_full")
+                return False
+
+        self.queue.append((coalesce_key, payload, time.perf_counter()))
+        self.has_data.set()
+        return True
+
+    async def _writer(self):
+        try:
+            while True:
+                await self.has_data.wait()
+                while self.queue:
+                    _, payload, enqueued_at = self.queue.popleft()
+                    await asyncio.wait_for(
+                        self.websocket.send_text(payload),
+                        timeout=settings.WS_SEND_TIMEOUT
+                    )
+                    self.manager.stats.record_sent(payload, (time.perf_counter() - enqueued_at) * 1000)
+                self.has_data.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Send failed for user {self.user_id}, dropping connection: {e}")
+            self.manager.stats.send_failures += 1
+            self.close()
+
+    def close(self):
+        """Stop the writer and unregister; closing the socket ends the receive loop"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.manager.disconnect(self.websocket)
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+
+    def stop(self):
+        self.closed = True
+        if self.writer_task and self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+
+
 class ConnectionManager:
     def __init__(self):
         # user_id -> list of websocket connections
         self.active_connections: Dict[int, List[WebSocket]] = {}
         # websocket -> user_id mapping
         self.connection_users: Dict[WebSocket, int] = {}
+        # websocket -> outbound queue + writer
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        # cross-process fan-out; this worker subscribes only to its local users
+        self.backplane = create_backplane()
+        self.subscribed_users: set = set()
+        self.stats = WebSocketStats()
+
+    async def start(self):
+        await self.backplane.start(self._on_backplane_message)
+
+    async def stop(self):
+        await self.backplane.stop()
+
+    async def _on_backplane_message(self, channel: str, envelope: dict):
+        """Deliver a frame published by any worker to the sockets held here"""
+        if channel == BROADCAST_CHANNEL:
+            exclude = envelope.get("exclude")
+            for user_id in list(self.active_connections):
+                if user_id != exclude:
+                    self._enqueue(envelope["data"], user_id, envelope.get("key"))
+        else:
+            user_id = int(channel.rsplit(":", 1)[1])
+            self._enqueue(envelope["data"], user_id, envelope.get("key"))
+
+    async def _unsubscribe_user(self, user_id: int):
+        # user may have reconnected while this task was pending
+        if user_id in self.active_connections or user_id not in self.subscribed_users:
+            return
+        self.subscribed_users.discard(user_id)
+        try:
+            await self.backplane.unsubscribe(user_channel(user_id))
+        except Exception as e:
+            logger.error(f"Backplane unsubscribe failed for user {user_id}: {e}")
 
     async def connect(self, websocket: WebSocket, user_id: int):
         await websocket.accept()
-        
+
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
-        
+
         self.active_connections[user_id].append(websocket)
         self.connection_users[websocket] = user_id
-        
+
+        client = ClientConnection(websocket, user_id, self)
+        self.clients[websocket] = client
+        client.start()
+        self.stats.connections_opened += 1
+
+        if user_id not in self.subscribed_users:
+            self.subscribed_users.add(user_id)
+            await self.backplane.subscribe(user_channel(user_id))
+
         logger.info(f"User {user_id} connected. Active connections: {len(self.active_connections[user_id])}")
 
     def disconnect(self, websocket: WebSocket):
         user_id = self.connection_users.get(websocket)
         if user_id and user_id in self.active_connections:
-            self.active_connections[user_id].remove(websocket)
+            if websocket in self.active_connections[user_id]:
+                self.active_connections[user_id].remove(websocket)
             if not self.active_connections[user_id]:
                 del self.active_connections[user_id]
-        
+                asyncio.create_task(self._unsubscribe_user(user_id))
+
         if websocket in self.connection_users:
             del self.connection_users[websocket]
-        
+
+        client = self.clients.pop(websocket, None)
+        if client:
+            client.stop()
+            self.stats.connections_closed += 1
+
         logger.info(f"User {user_id} disconnected")
 
+    def _enqueue(self, message: str, user_id: int, coalesce_key: Optional[str] = None):
+        for connection in list(self.active_connections.get(user_id, [])):
+            client = self.clients.get(connection)
+            if client:
+                client.enqueue(message, coalesce_key)
+
+    def send_to_connection(self, websocket: WebSocket, message: str) -> bool:
+        """queue a frame for one socket only (command replies)"""
+        client = self.clients.get(websocket)
+        return client.enqueue(message) if client else False
+
     async def send_personal_message(self, message: str, user_id: int):
-        """send message to specific user (all their connections)"""
-        if user_id in self.active_connections:
-            connections_to_remove = []
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_text(message)
-                except:
-                    connections_to_remove.append(connection)
-            
-            # remove broken connections
-            for connection in connections_to_remove:
-                self.active_connections[user_id].remove(connection)
-                if connection in self.connection_users:
-                    del self.connection_users[connection]
+        """send message to specific user (all their connections, on any worker)
+
+        Delivery happens on each connection's writer task, so a slow
+        socket never delays the caller or other recipients.
+        """
+        await self.backplane.publish(user_channel(user_id), {"data": message})
 
     async def send_to_chat(self, message: dict, chat_participants: List[int]):
         """send message to all participants of a chat"""
-        message_str = json.dumps(message)
-        
-        for user_id in chat_participants:
-            await self.send_personal_message(message_str, user_id)
-
-    async def broadcast_user_status(self, user_id: int, is_online: bool):
-        """notify all users about user's online status"""
-        status_message = {
-            "type": "user_status",
-            "user_id": user_id,
-            "is_online": is_online
-        }
-        
-        # send to all connected users
-        for connected_user_id in self.active_connections:
-            if connected_user_id != user_id:
-                await self.send_personal_message(json.dumps(status_message), connected_user_id)
+        envelope = {"data": json.dumps(message)}
+
+        await self.backplane.publish_many(
+            (user_channel(user_id), envelope) for user_id in chat_participants
+        )
+
+    async def send_personal_messages(self, messages: Iterable[Tuple[int, str]]):
+        """send a different frame to each user in one backplane round trip"""
+        await self.backplane.publish_many(
+            (user_channel(user_id), {"data": message}) for user_id, message in messages
+        )
 
     def get_online_users(self) -> List[int]:
         """get list of currently online user ids"""
         return list(self.active_connections.keys())
 
+    def get_stats(self, top: int = 10) -> dict:
+        """connection, queue and send statistics for this worker"""
+        sockets_per_user: Dict[str, int] = {}
+        for connections in self.active_connections.values():
+            key = str(len(connections))
+            sockets_per_user[key] = sockets_per_user.get(key, 0) + 1
+
+        depths = sorted(
+            ((len(client.queue), client.user_id) for client in self.clients.values()),
+            reverse=True
+        )
+
+        return {
+            "active_users": len(self.active_connections),
+            "active_sockets": len(self.clients),
+            "sockets_per_user": sockets_per_user,
+            "queue_depth": {
+                "total": sum(depth for depth, _ in depths),
+                "max": depths[0][0] if depths else 0,
+                "limit": settings.WS_SEND_QUEUE_SIZE,
+                "deepest": [
+                    {"user_id": user_id, "depth": depth}
+                    for depth, user_id in depths[:top] if depth
+                ],
+            },
+            "backplane": settings.WS_BACKPLANE,
+            "counters": self.stats.snapshot(),
+        }
+
 # global instance
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager()
@@ -0,0 +1,156 @@
+# app/ws_commands.py
+# Команды, которые клиент шлет по уже авторизованному сокету.
+#
+# client -> server: {"type": "send_message", "id": "c-17", "chatId": 3, "text": "hi"}
+# server -> client: {"type": "ack", "id": "c-17", "ok": true, "data": {...}}
+#                   {"type": "ack", "id": "c-17", "ok": false, "error": {"status": 403, "detail": "..."}}
+#
+# "id" is chosen by the client and doubles as an idempotency key: a retried
+# frame with an id seen recently on this connection gets the original ack
+# back instead of being executed twice. Frames without an id get no ack.
+# send_message also takes "clientMessageId", which dedupes across
+# reconnects and REST retries (see app/services/message_dedupe.py).
+from collections import OrderedDict
+from typing import Optional
+import json
+import logging
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
+from app.models.user import User
+from app.schemas.message import MessageCreate, MessageUpdate
+from app.services import message_write
+from app.websocket_manager import manager
+
+logger = logging.getLogger(__name__)
+
+# how many recent command ids a connection remembers for retries
+RECENT_COMMANDS_LIMIT = 256
+
+
+class CommandHandler:
+    """Per-connection command dispatcher; the user is authenticated once on connect.
+
+    `user` is a detached snapshot (id, name, ...) kept as connection state;
+    it is never added to a session.
+    """
+
+    def __init__(self, user: User):
+        self.user = user
+        self.recent_acks: "OrderedDict[str, dict]" = OrderedDict()
+        self.handlers = {
+            "send_message": self.send_message,
+            "edit_message": self.edit_message,
+            "delete_message": self.delete_message,
+            "mark_read": self.mark_read,
+            "typing": self.typing,
+        }
+
+    async def handle(self, raw: str) -> Optional[dict]:
+        """Run one frame; returns the reply frame (or None if there is nothing to say)"""
+        try:
+            frame = json.loads(raw)
+            if not isinstance(frame, dict):
+                raise ValueError("frame must be an object")
+        except ValueError:
+            return {"type": "error", "error": {"status": status.HTTP_400_BAD_REQUEST, "detail": "Invalid JSON frame"}}
+
+        if frame.get("type") == "ping":
+            return {"type": "pong"}
+
+        command_id = frame.get("id")
+        if command_id is not None:
+            command_id = str(command_id)
+            if command_id in self.recent_acks:
+                return self.recent_acks[command_id]
+
+        handler = self.handlers.get(frame.get("type"))
+        if handler is None:
+            reply = self._error(command_id, status.HTTP_400_BAD_REQUEST, f"Unknown command: {frame.get('type')}")
+        else:
+            try:
+                # Pool connection only for the duration of one command
+                async with AsyncSessionLocal() as db:
+                    data = await handler(db, frame)
+                reply = {"type": "ack", "id": command_id, "ok": True, "data": data}
+            except HTTPException as e:
+                reply = self._error(command_id, e.status_code, e.detail)
+            except ValidationError as e:
+                reply = self._error(command_id, status.HTTP_422_UNPROCESSABLE_ENTITY, e.errors(include_url=False, include_context=False))
+            except Exception as e:
+                logger.error(f"WebSocket command {frame.get('type')} failed for user {self.user.id}: {e}")
+                reply = self._error(command_id, status.HTTP_500_INTERNAL_SERVER_ERROR, "Command failed")
+
+        if command_id is None:
+            return None if reply["ok"] else reply
+
+        # server-side failures are not remembered, so a retry runs again
+        if reply["ok"] or reply["error"]["status"] < 500:
+            self.recent_acks[command_id] = reply
+            if len(self.recent_acks) > RECENT_COMMANDS_LIMIT:
+                self.recent_acks.popitem(last=False)
+        return reply
+
+    @staticmethod
+    def _error(command_id: Optional[str], status_code: int, detail) -> dict:
+        return {"type": "ack", "id": command_id, "ok": False, "error": {"status": status_code, "detail": detail}}
+
+    async def send_message(self, db: AsyncSession, frame: dict) -> dict:
+        # "type" is taken by the command name, so the message kind travels as messageType
+        data = MessageCreate(
+            chatId=frame.get("chatId"),
+            text=frame.get("text"),
+            type=frame.get("messageType", "text"),
+            clientMessageId=frame.get("clientMessageId")
+        )
+        message = await message_write.create_message(
+            db, self.user, data.chat_id, data.content, data.message_type, data.client_message_id
+        )
+        return message_write.new_message_payload(message, self.user.name)
+
+    async def edit_message(self, db: AsyncSession, frame: dict) -> dict:
+        data = MessageUpdate(text=frame.get("text"))
+        message = await message_write.edit_message(db, self.user, _require_int(frame, "messageId"), data.content)
+        return {
+            "id": message.id,
+            "chatId": message.chat_id,
+            "text": message.content,
+            "isEdited": True,
+            "editedAt": message.edited_at.isoformat()
+        }
+
+    async def delete_message(self, db: AsyncSession, frame: dict) -> dict:
+        message_id = _require_int(frame, "messageId")
+        chat_id = await message_write.delete_message(db, self.user, message_id)
+        return {"id": message_id, "chatId": chat_id}
+
+    async def mark_read(self, db: AsyncSession, frame: dict) -> dict:
+        chat_id = _require_int(frame, "chatId")
+        # without messageId the whole chat is read
+        message_id = _require_int(frame, "messageId") if frame.get("messageId") is not None else None
+        await message_write.mark_chat_read(db, self.user, chat_id, message_id)
+        return {"chatId": chat_id, "messageId": message_id}
+
+    async def typing(self, db: AsyncSession, frame: dict) -> dict:
+        chat_id = _require_int(frame, "chatId")
+        await message_write.require_participant(db, chat_id, self.user.id)
+
+        participant_ids = await message_write.get_participant_ids(db, chat_id)
+        await manager.send_to_chat({
+            "type": "typing",
+            "chatId": chat_id,
+            "userId": self.user.id,
+            "isTyping": bool(frame.get("isTyping", True))
+        }, [user_id for user_id in participant_ids if user_id != self.user.id])
+        return {"chatId": chat_id}
+
+
+def _require_int(frame: dict, field: str) -> int:
+    try:
+        return int(frame[field])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{field} is required"
+        )
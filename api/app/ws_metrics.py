@@ -0,0 +1,124 @@
+# app/ws_metrics.py
+from typing import Dict, List
+
+# enqueue -> written to the socket, milliseconds
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> List[tuple]:
+        result, total = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "avg": round(self.sum / self.count, 3) if self.count else 0.0,
+            "buckets": {str(bound): total for bound, total in self.cumulative()},
+        }
+
+
+class WebSocketStats:
+    """Outbound frame counters; touched only from the event loop, so no locking"""
+
+    def __init__(self):
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.frames_sent = 0
+        # frames are json.dumps output (ASCII), so len() is the byte count
+        self.bytes_sent = 0
+        self.send_failures = 0
+        self.slow_consumer_disconnects = 0
+        # reason -> count: queue_full, coalesced, closed
+        self.dropped: Dict[str, int] = {}
+        self.send_latency_ms = Histogram()
+
+    def record_sent(self, payload: str, latency_ms: float):
+        self.frames_sent += 1
+        self.bytes_sent += len(payload)
+        self.send_latency_ms.observe(latency_ms)
+
+    def record_dropped(self, reason: str):
+        self.dropped[reason] = self.dropped.get(reason, 0) + 1
+
+    def snapshot(self) -> dict:
+        return {
+            "connections_opened": self.connections_opened,
+            "connections_closed": self.connections_closed,
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+            "send_failures": self.send_failures,
+            "slow_consumer_disconnects": self.slow_consumer_disconnects,
+            "dropped": dict(self.dropped),
+            "send_latency_ms": self.send_latency_ms.snapshot(),
+        }
+
+
+def render_prometheus(stats: dict) -> str:
+    """Render ConnectionManager.get_stats() in the Prometheus text format"""
+    counters = stats["counters"]
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    metric("ws_active_users", "gauge", "Users with at least one socket on this worker",
+           [({}, stats["active_users"])])
+    metric("ws_active_sockets", "gauge", "Open sockets on this worker",
+           [({}, stats["active_sockets"])])
+    metric("ws_users_by_socket_count", "gauge", "Users grouped by number of open sockets",
+           [({"sockets": k}, v) for k, v in stats["sockets_per_user"].items()])
+    metric("ws_queue_depth_total", "gauge", "Frames waiting in all outbound queues",
+           [({}, stats["queue_depth"]["total"])])
+    metric("ws_queue_depth_max", "gauge", "Deepest outbound queue",
+           [({}, stats["queue_depth"]["max"])])
+    metric("ws_connections_opened_total", "counter", "Sockets accepted",
+           [({}, counters["connections_opened"])])
+    metric("ws_connections_closed_total", "counter", "Sockets closed",
+           [({}, counters["connections_closed"])])
+    metric("ws_frames_sent_total", "counter", "Frames written to sockets",
+           [({}, counters["frames_sent"])])
+    metric("ws_bytes_sent_total", "counter", "Bytes written to sockets",
+           [({}, counters["bytes_sent"])])
+    metric("ws_send_failures_total", "counter", "Socket writes that failed or timed out",
+           [({}, counters["send_failures"])])
+    metric("ws_slow_consumer_disconnects_total", "counter", "Sockets closed by the disconnect policy",
+           [({}, counters["slow_consumer_disconnects"])])
+    metric("ws_frames_dropped_total", "counter", "Frames dropped before reaching the socket",
+           [({"reason": k}, v) for k, v in counters["dropped"].items()])
+
+    latency = counters["send_latency_ms"]
+    name = "ws_send_latency_ms"
+    lines.append(f"# HELP {name} Time from enqueue to socket write")
+    lines.append(f"# TYPE {name} histogram")
+    for bound, total in latency["buckets"].items():
+        lines.append(f'{name}_bucket{{le="{bound}"}} {total}')
+    lines.append(f'{name}_bucket{{le="+Inf"}} {latency["count"]}')
+    lines.append(f"{name}_sum {latency['sum']}")
+    lines.append(f"{name}_count {latency['count']}")
+
+    return "\n".join(lines) + "\n"
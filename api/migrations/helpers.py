@@ -0,0 +1,19 @@
+# migrations/helpers.py
+# main.py всё ещё вызывает Base.metadata.create_all, поэтому база может уже
+# содержать объекты из миграций - проверяем перед созданием.
+import sqlalchemy as sa
+from alembic import op
+
+
+def has_table(table: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def has_column(table: str, column: str) -> bool:
+    columns = sa.inspect(op.get_bind()).get_columns(table)
+    return any(c["name"] == column for c in columns)
+
+
+def has_index(table: str, index: str) -> bool:
+    indexes = sa.inspect(op.get_bind()).get_indexes(table)
+    return any(i["name"] == index for i in indexes)
@@ -0,0 +1,94 @@
+"""baseline schema (as created by Base.metadata.create_all)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from migrations.helpers import has_table
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_table("users"):
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("username", sa.String(50), nullable=False),
+            sa.Column("email", sa.String(100), nullable=False),
+            sa.Column("hashed_password", sa.String(255), nullable=False),
+            sa.Column("name", sa.String(100), nullable=False),
+            sa.Column("bio", sa.Text(), nullable=True),
+            sa.Column("avatar_url", sa.String(255), nullable=True),
+            sa.Column("phone", sa.String(20), nullable=True),
+            sa.Column("is_online", sa.Boolean(), nullable=True),
+            sa.Column("last_seen", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    if not has_table("chats"):
+        op.create_table(
+            "chats",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String(100), nullable=True),
+            sa.Column("is_group", sa.Boolean(), nullable=True),
+            sa.Column("avatar_url", sa.String(255), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        )
+        op.create_index("ix_chats_id", "chats", ["id"])
+
+    if not has_table("chat_participants"):
+        op.create_table(
+            "chat_participants",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("chat_id", sa.Integer(), sa.ForeignKey("chats.id"), nullable=False),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("is_pinned", sa.Boolean(), nullable=True),
+            sa.Column("is_muted", sa.Boolean(), nullable=True),
+            sa.Column("unread_count", sa.Integer(), nullable=True),
+            sa.Column("joined_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_chat_participants_id", "chat_participants", ["id"])
+
+    if not has_table("contacts"):
+        op.create_table(
+            "contacts",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("contact_user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_contacts_id", "contacts", ["id"])
+
+    if not has_table("messages"):
+        op.create_table(
+            "messages",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("chat_id", sa.Integer(), sa.ForeignKey("chats.id"), nullable=False),
+            sa.Column("sender_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("content", sa.Text(), nullable=False),
+            sa.Column("message_type", sa.String(20), nullable=True),
+            sa.Column("file_url", sa.String(255), nullable=True),
+            sa.Column("is_edited", sa.Boolean(), nullable=True),
+            sa.Column("edited_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_messages_id", "messages", ["id"])
+
+
+def downgrade():
+    op.drop_table("messages")
+    op.drop_table("contacts")
+    op.drop_table("chat_participants")
+    op.drop_table("chats")
+    op.drop_table("users")
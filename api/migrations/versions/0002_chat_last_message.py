@@ -0,0 +1,56 @@
+"""denormalized last-message pointer and activity timestamp on chats
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from migrations.helpers import has_column, has_index
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("chats") as batch:
+        if not has_column("chats", "last_message_id"):
+            batch.add_column(sa.Column("last_message_id", sa.Integer(), nullable=True))
+        if not has_column("chats", "last_message_preview"):
+            batch.add_column(sa.Column("last_message_preview", sa.String(200), nullable=True))
+        if not has_column("chats", "last_activity_at"):
+            batch.add_column(sa.Column("last_activity_at", sa.DateTime(timezone=True), nullable=True))
+
+    if not has_index("chats", "ix_chats_last_activity_at"):
+        op.create_index("ix_chats_last_activity_at", "chats", ["last_activity_at"])
+
+    # Backfill: последний по (created_at, id) message каждого чата
+    op.execute("""
+        UPDATE chats SET last_message_id = (
+            SELECT m.id FROM messages m
+            WHERE m.chat_id = chats.id
+            ORDER BY m.created_at DESC, m.id DESC
+            LIMIT 1
+        )
+    """)
+    op.execute("""
+        UPDATE chats SET
+            last_message_preview = (
+                SELECT substr(m.content, 1, 200) FROM messages m
+                WHERE m.id = chats.last_message_id
+            ),
+            last_activity_at = COALESCE(
+                (SELECT m.created_at FROM messages m WHERE m.id = chats.last_message_id),
+                chats.created_at
+            )
+    """)
+
+
+def downgrade():
+    op.drop_index("ix_chats_last_activity_at", table_name="chats")
+    with op.batch_alter_table("chats") as batch:
+        batch.drop_column("last_activity_at")
+        batch.drop_column("last_message_preview")
+        batch.drop_column("last_message_id")
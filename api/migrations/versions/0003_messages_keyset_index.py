@@ -0,0 +1,24 @@
+"""composite index for keyset pagination of chat history
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+from migrations.helpers import has_index
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_index("messages", "ix_messages_chat_created_id"):
+        op.create_index(
+            "ix_messages_chat_created_id", "messages", ["chat_id", "created_at", "id"]
+        )
+
+
+def downgrade():
+    op.drop_index("ix_messages_chat_created_id", table_name="messages")
@@ -0,0 +1,55 @@
+"""composite and unique indexes for the router access paths
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from migrations.helpers import has_index
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def _unique_constraint_names(table: str) -> set:
+    inspector = sa.inspect(op.get_bind())
+    names = {c["name"] for c in inspector.get_unique_constraints(table)}
+    # SQLite/PG показывают уникальные ограничения и как индексы
+    names |= {i["name"] for i in inspector.get_indexes(table) if i.get("unique")}
+    return names
+
+
+def upgrade():
+    # Дубликаты сломали бы уникальные ограничения - оставляем самую раннюю строку
+    op.execute("""
+        DELETE FROM chat_participants WHERE id NOT IN (
+            SELECT MIN(id) FROM chat_participants GROUP BY chat_id, user_id
+        )
+    """)
+    op.execute("""
+        DELETE FROM contacts WHERE id NOT IN (
+            SELECT MIN(id) FROM contacts GROUP BY user_id, contact_user_id
+        )
+    """)
+
+    if "uq_chat_participants_chat_user" not in _unique_constraint_names("chat_participants"):
+        with op.batch_alter_table("chat_participants") as batch:
+            batch.create_unique_constraint("uq_chat_participants_chat_user", ["chat_id", "user_id"])
+
+    if not has_index("chat_participants", "ix_chat_participants_user_chat"):
+        op.create_index("ix_chat_participants_user_chat", "chat_participants", ["user_id", "chat_id"])
+
+    if "uq_contacts_user_contact" not in _unique_constraint_names("contacts"):
+        with op.batch_alter_table("contacts") as batch:
+            batch.create_unique_constraint("uq_contacts_user_contact", ["user_id", "contact_user_id"])
+
+
+def downgrade():
+    with op.batch_alter_table("contacts") as batch:
+        batch.drop_constraint("uq_contacts_user_contact", type_="unique")
+    op.drop_index("ix_chat_participants_user_chat", table_name="chat_participants")
+    with op.batch_alter_table("chat_participants") as batch:
+        batch.drop_constraint("uq_chat_participants_chat_user", type_="unique")
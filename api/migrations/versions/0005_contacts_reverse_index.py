@@ -0,0 +1,22 @@
+"""reverse contact lookup index for presence audiences
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+from migrations.helpers import has_index
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_index("contacts", "ix_contacts_contact_user"):
+        op.create_index("ix_contacts_contact_user", "contacts", ["contact_user_id", "user_id"])
+
+
+def downgrade():
+    op.drop_index("ix_contacts_contact_user", table_name="contacts")
@@ -0,0 +1,53 @@
+"""per-participant read watermark replacing the unread counter
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from migrations.helpers import has_column, has_index
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("chat_participants") as batch:
+        if not has_column("chat_participants", "last_read_message_id"):
+            batch.add_column(sa.Column("last_read_message_id", sa.Integer(), nullable=True))
+
+    if not has_index("messages", "ix_messages_chat_id_id"):
+        op.create_index("ix_messages_chat_id_id", "messages", ["chat_id", "id"])
+
+    # Backfill: прочитанные чаты - до последнего сообщения
+    op.execute("""
+        UPDATE chat_participants SET last_read_message_id = (
+            SELECT c.last_message_id FROM chats c WHERE c.id = chat_participants.chat_id
+        )
+        WHERE COALESCE(unread_count, 0) = 0
+    """)
+
+    # ...остальные - так, чтобы выше знака осталось unread_count чужих сообщений
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(
+        "SELECT id, chat_id, user_id, unread_count FROM chat_participants WHERE unread_count > 0"
+    )).fetchall()
+    for participant_id, chat_id, user_id, unread_count in rows:
+        watermark = conn.execute(sa.text("""
+            SELECT id FROM messages
+            WHERE chat_id = :chat_id AND sender_id != :user_id
+            ORDER BY id DESC
+            LIMIT 1 OFFSET :unread
+        """), {"chat_id": chat_id, "user_id": user_id, "unread": unread_count}).scalar()
+        conn.execute(sa.text(
+            "UPDATE chat_participants SET last_read_message_id = :watermark WHERE id = :id"
+        ), {"watermark": watermark, "id": participant_id})
+
+
+def downgrade():
+    op.drop_index("ix_messages_chat_id_id", table_name="messages")
+    with op.batch_alter_table("chat_participants") as batch:
+        batch.drop_column("last_read_message_id")
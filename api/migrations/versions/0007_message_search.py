@@ -0,0 +1,22 @@
+"""full-text search index for messages (FTS5 / tsvector + GIN)
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+from alembic import op
+from app.services.message_search import install_search_index, drop_search_index
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # IF NOT EXISTS inside: main.py may have installed it already
+    install_search_index(op.get_bind())
+
+
+def downgrade():
+    drop_search_index(op.get_bind())
@@ -0,0 +1,58 @@
+"""canonical participant pair key for private chats
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from migrations.helpers import has_column, has_index
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("chats") as batch:
+        if not has_column("chats", "dm_user_low"):
+            batch.add_column(sa.Column("dm_user_low", sa.Integer(), nullable=True))
+        if not has_column("chats", "dm_user_high"):
+            batch.add_column(sa.Column("dm_user_high", sa.Integer(), nullable=True))
+
+    conn = op.get_bind()
+
+    # Backfill: личные чаты ровно с двумя разными участниками
+    conn.execute(sa.text("""
+        UPDATE chats SET
+            dm_user_low = (SELECT min(cp.user_id) FROM chat_participants cp WHERE cp.chat_id = chats.id),
+            dm_user_high = (SELECT max(cp.user_id) FROM chat_participants cp WHERE cp.chat_id = chats.id)
+        WHERE is_group = :is_group AND id IN (
+            SELECT chat_id FROM chat_participants
+            GROUP BY chat_id
+            HAVING count(*) = 2 AND count(DISTINCT user_id) = 2
+        )
+    """), {"is_group": False})
+
+    # Дубликаты пары (старый create_chat не был защищен от гонок): ключ остается
+    # у самого раннего чата - его же находил прежний перебор
+    conn.execute(sa.text("""
+        UPDATE chats SET dm_user_low = NULL, dm_user_high = NULL
+        WHERE dm_user_low IS NOT NULL AND EXISTS (
+            SELECT 1 FROM chats earlier
+            WHERE earlier.dm_user_low = chats.dm_user_low
+              AND earlier.dm_user_high = chats.dm_user_high
+              AND earlier.id < chats.id
+        )
+    """))
+
+    if not has_index("chats", "ix_chats_dm_pair"):
+        op.create_index("ix_chats_dm_pair", "chats", ["dm_user_low", "dm_user_high"], unique=True)
+
+
+def downgrade():
+    op.drop_index("ix_chats_dm_pair", table_name="chats")
+    with op.batch_alter_table("chats") as batch:
+        batch.drop_column("dm_user_high")
+        batch.drop_column("dm_user_low")
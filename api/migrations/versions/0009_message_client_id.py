@@ -0,0 +1,34 @@
+"""client-supplied message id for idempotent sends
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from migrations.helpers import has_column, has_index
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Уникальный индекс, а не constraint: на SQLite constraint потребовал бы
+    # пересоздания messages, а вместе с таблицей пропали бы FTS-триггеры (0007)
+    with op.batch_alter_table("messages") as batch:
+        if not has_column("messages", "client_message_id"):
+            batch.add_column(sa.Column("client_message_id", sa.String(64), nullable=True))
+
+    # Существующие строки получают NULL - NULL'ы в уникальном индексе не конфликтуют
+    if not has_index("messages", "ix_messages_sender_client_id"):
+        op.create_index(
+            "ix_messages_sender_client_id", "messages", ["sender_id", "client_message_id"], unique=True
+        )
+
+
+def downgrade():
+    op.drop_index("ix_messages_sender_client_id", table_name="messages")
+    with op.batch_alter_table("messages") as batch:
+        batch.drop_column("client_message_id")
@@ -0,0 +1,30 @@
+"""normalise messages.created_at text format on SQLite
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite хранит время текстом: server_default писал 'YYYY-MM-DD HH:MM:SS',
+    # SQLAlchemy пишет и связывает 'YYYY-MM-DD HH:MM:SS.ffffff'. В одном формате
+    # сравнение (created_at, id) в курсорах истории снова совпадает с порядком времени.
+    # FTS-триггер срабатывает только на UPDATE OF content - индекс не трогается.
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    op.execute(
+        "UPDATE messages SET created_at = created_at || '.000000' "
+        "WHERE length(created_at) = 19"
+    )
+
+
+def downgrade():
+    # the long format is what SQLAlchemy writes anyway
+    pass
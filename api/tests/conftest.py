@@ -0,0 +1,53 @@
+# tests/conftest.py
+# Тесты идут на временной SQLite-базе: окружение выставляется до импорта app,
+# потому что Settings и движки создаются при импорте.
+import os
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="messenger-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+os.environ["WS_BACKPLANE"] = "memory"
+os.environ["AUTH_CACHE_BACKEND"] = "memory"
+# app.main mounts ./static
+os.makedirs(os.path.join(_workdir, "static"), exist_ok=True)
+os.chdir(_workdir)
+
+import httpx
+import pytest
+from app.auth_cache import auth_cache
+from app.database import Base, async_engine, engine
+from app.main import app
+from app.presence_manager import presence
+from app.services.message_dedupe import message_dedupe
+from app.user_search import user_search_index
+from app.websocket_manager import manager
+
+
+@pytest.fixture(autouse=True)
+async def clean_state():
+    """Empty tables and process-global caches around every test"""
+    with engine.begin() as connection:
+        # FTS rows go away through the messages delete trigger
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+    auth_cache._entries.clear()
+    message_dedupe._entries.clear()
+    user_search_index.__init__()
+    for state in (presence.connection_counts, presence.online, presence.audiences,
+                  presence.pending_events, presence.pending_writes):
+        state.clear()
+
+    yield
+
+    # pooled aiosqlite connections must not outlive the test's event loop
+    await async_engine.dispose()
+
+
+@pytest.fixture
+async def client():
+    """HTTP client against the ASGI app; the backplane runs in memory"""
+    await manager.start()
+    async with httpx.AsyncClient(app=app, base_url="http://test") as http:
+        yield http
+    await manager.stop()
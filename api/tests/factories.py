@@ -0,0 +1,66 @@
+# tests/factories.py
+# Минимальные строки для тестов: пользователи, чаты, участники, сообщения.
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import select
+from app.auth import create_access_token
+from app.database import AsyncSessionLocal
+from app.models.chat import Chat, ChatParticipant
+from app.models.message import Message
+from app.models.user import User
+from app.services.read_state import unread_count_subquery
+
+
+async def create_user(username: str, name: Optional[str] = None) -> User:
+    async with AsyncSessionLocal() as db:
+        user = User(
+            username=username,
+            email=f"{username}@example.com",
+            hashed_password="not-a-real-hash",
+            name=name or username.title()
+        )
+        db.add(user)
+        await db.commit()
+        return user
+
+
+async def create_chat(*users: User, is_group: bool = False, name: Optional[str] = None) -> Chat:
+    async with AsyncSessionLocal() as db:
+        chat = Chat(name=name, is_group=is_group)
+        db.add(chat)
+        await db.flush()
+        db.add_all(ChatParticipant(chat_id=chat.id, user_id=user.id) for user in users)
+        await db.commit()
+        return chat
+
+
+async def add_message(
+    chat: Chat,
+    sender: User,
+    content: str,
+    created_at: Optional[datetime] = None,
+    client_message_id: Optional[str] = None
+) -> Message:
+    """Raw row without the write path's side effects (pointer, watermark, broadcast)"""
+    async with AsyncSessionLocal() as db:
+        message = Message(chat_id=chat.id, sender_id=sender.id, content=content, client_message_id=client_message_id)
+        if created_at is not None:
+            message.created_at = created_at
+        db.add(message)
+        await db.commit()
+        return message
+
+
+async def unread_count(chat: Chat, user: User) -> int:
+    """Unread counter as the chat list derives it from the watermark"""
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(
+            select(unread_count_subquery(chat.id, user.id, ChatParticipant.last_read_message_id)).where(
+                ChatParticipant.chat_id == chat.id,
+                ChatParticipant.user_id == user.id
+            )
+        )
+
+
+def auth_headers(user: User) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': user.username})}"}
@@ -0,0 +1,50 @@
+# tests/test_message_history.py
+from datetime import datetime
+from app.database import AsyncSessionLocal
+from app.services.message_history import get_message_page
+from app.services.message_write import create_message
+from tests.factories import add_message, create_chat, create_user
+
+
+async def _walk(chat_id, direction, limit=2):
+    """Every message id reachable by following cursors from the first page"""
+    seen = []
+    async with AsyncSessionLocal() as db:
+        page = await get_message_page(db, chat_id, limit=limit)
+        if direction == "before":
+            while True:
+                seen[:0] = [row.id for row in page["messages"]]
+                if not page["next_cursor"]:
+                    return seen
+                page = await get_message_page(db, chat_id, before=page["next_cursor"], limit=limit)
+
+        # from the oldest page towards the present
+        while page["next_cursor"]:
+            page = await get_message_page(db, chat_id, before=page["next_cursor"], limit=limit)
+        seen = [row.id for row in page["messages"]]
+        while page["prev_cursor"]:
+            page = await get_message_page(db, chat_id, after=page["prev_cursor"], limit=limit)
+            seen += [row.id for row in page["messages"]]
+        return seen
+
+
+async def test_pages_messages_sent_within_one_second():
+    alice, bob = await create_user("alice"), await create_user("bob")
+    chat = await create_chat(alice, bob)
+    ids = []
+    async with AsyncSessionLocal() as db:
+        for i in range(7):
+            ids.append((await create_message(db, alice, chat.id, f"m{i}")).id)
+
+    assert await _walk(chat.id, "before") == ids
+    assert await _walk(chat.id, "after") == ids
+
+
+async def test_pages_messages_with_identical_timestamps():
+    alice, bob = await create_user("alice"), await create_user("bob")
+    chat = await create_chat(alice, bob)
+    moment = datetime(2024, 1, 1, 10, 0, 0)
+    ids = [(await add_message(chat, bob, f"m{i}", created_at=moment)).id for i in range(5)]
+
+    assert await _walk(chat.id, "before") == ids
+    assert await _walk(chat.id, "after") == ids
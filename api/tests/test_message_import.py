@@ -0,0 +1,48 @@
+# tests/test_message_import.py
+import json
+from app.database import AsyncSessionLocal
+from app.services import read_state
+from app.services.message_import import import_messages
+from app.services.message_write import create_message
+from tests.factories import create_chat, create_user, unread_count
+
+
+async def _ndjson(records):
+    yield "".join(json.dumps(record) + "\n" for record in records).encode()
+
+
+def _history(chat, sender, count):
+    # back-dated: older than anything the chat already has, but higher ids
+    return [
+        {"chatId": chat.id, "senderId": sender.id, "text": f"old {i}", "time": f"2020-01-01T10:00:{i:02d}Z"}
+        for i in range(count)
+    ]
+
+
+async def test_import_mark_read_covers_back_dated_history():
+    alice, bob = await create_user("alice"), await create_user("bob")
+    chat = await create_chat(alice, bob)
+    async with AsyncSessionLocal() as db:
+        await create_message(db, bob, chat.id, "live")
+
+    async with AsyncSessionLocal() as db:
+        report = await import_messages(db, _ndjson(_history(chat, bob, 3)), mark_read=True)
+
+    assert report.inserted == 3
+    assert await unread_count(chat, alice) == 0
+
+
+async def test_mark_read_after_back_dated_import():
+    alice, bob = await create_user("alice"), await create_user("bob")
+    chat = await create_chat(alice, bob)
+    async with AsyncSessionLocal() as db:
+        await create_message(db, bob, chat.id, "live")
+
+    async with AsyncSessionLocal() as db:
+        await import_messages(db, _ndjson(_history(chat, bob, 3)))
+    assert await unread_count(chat, alice) == 4
+
+    async with AsyncSessionLocal() as db:
+        assert await read_state.mark_read(db, chat.id, alice.id)
+        await db.commit()
+    assert await unread_count(chat, alice) == 0
@@ -0,0 +1,42 @@
+# tests/test_message_write.py
+import pytest
+from app.services import message_write
+from tests.factories import add_message, auth_headers, create_chat, create_user
+
+
+@pytest.fixture
+def lose_lookup_race(monkeypatch):
+    """The pre-insert lookup misses, as if another worker inserted in between"""
+    lookup = message_write._find_by_client_id
+    calls = []
+
+    async def find_by_client_id(db, sender_id, client_message_id):
+        calls.append(client_message_id)
+        if len(calls) == 1:
+            return None
+        return await lookup(db, sender_id, client_message_id)
+
+    monkeypatch.setattr(message_write, "_find_by_client_id", find_by_client_id)
+    return calls
+
+
+@pytest.mark.parametrize("route", ["messages", "chat_messages"])
+async def test_duplicate_client_id_on_unique_index_returns_original(client, lose_lookup_race, route):
+    alice, bob = await create_user("alice"), await create_user("bob")
+    chat = await create_chat(alice, bob)
+    original = await add_message(chat, alice, "hello", client_message_id="retry-1")
+
+    if route == "messages":
+        response = await client.post("/api/messages/", headers=auth_headers(alice), json={
+            "chatId": chat.id, "text": "hello", "clientMessageId": "retry-1"
+        })
+    else:
+        response = await client.post(f"/api/chats/{chat.id}/messages", headers=auth_headers(alice), json={
+            "text": "hello", "clientMessageId": "retry-1"
+        })
+
+    assert response.status_code == 200, response.text
+    assert response.json()["id"] == original.id
+    assert response.json()["senderName"] == "Alice"
+    # the unique index rejected the insert and the row was looked up again
+    assert lose_lookup_race == ["retry-1", "retry-1"]
@@ -167,16 +167,27 @@ async getMessages(chatId, offset = 0, limit = 50) {
     }
 }
     
-    async sendMessage(chatId, text) {
-        const response = await fetch(`${this.baseUrl}/chats/${chatId}/messages`, {
-            method: 'POST',
-            headers: {
-                ...this.getAuthHeaders(),
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ text })
-        });
-        return await response.json();
+    async sendMessage(chatId, text, retries = 2) {
+        // Один clientMessageId на все попытки: сервер вернет уже созданное
+        // сообщение вместо дубля, если ответ потерялся по дороге
+        const clientMessageId = crypto.randomUUID();
+        for (let attempt = 0; ; attempt++) {
+            try {
+                const response = await fetch(`${this.baseUrl}/chats/${chatId}/messages`, {
+                    method: 'POST',
+                    headers: {
+                        ...this.getAuthHeaders(),
+                        'Content-Type': 'application/json'
+                    },
+                    body: JSON.stringify({ text, clientMessageId })
+                });
+                return await response.json();
+            } catch (error) {
+                // fetch падает только на сетевых ошибках - их и повторяем
+                if (attempt >= retries) throw error;
+                await new Promise(resolve => setTimeout(resolve, 500 * (attempt + 1)));
+            }
+        }
     }
 
     async getMessagesBefore(chatId, messageId, limit = 20) {
@@ -186,6 +197,18 @@ async getMessages(chatId, offset = 0, limit = 50) {
         return await response.json();
     }
     
+    // Курсорная пагинация: { messages, next_cursor (старее), prev_cursor (новее) }
+    async getMessagesPage(chatId, { before = null, after = null, limit = 50 } = {}) {
+        const params = new URLSearchParams({ limit });
+        if (before) params.set('before', before);
+        if (after) params.set('after', after);
+        
+        const response = await fetch(`${this.baseUrl}/chats/${chatId}/messages/history?${params}`, {
+            headers: this.getAuthHeaders()
+        });
+        return await response.json();
+    }
+    
     async searchMessages(chatId, query, limit = 50) {
         const response = await fetch(`${this.baseUrl}/chats/${chatId}/messages/search?q=${encodeURIComponent(query)}&limit=${limit}`, {
             headers: this.getAuthHeaders()
@@ -241,22 +264,44 @@ async getMessages(chatId, offset = 0, limit = 50) {
     }
 
     async getAllUsers() {
-        const response = await fetch(`${this.baseUrl}/users`, {
-            headers: this.getAuthHeaders()
-        });
-        return await response.json();
+        // Сервер отдает справочник страницами; курсор следующей - в X-Next-Cursor.
+        // ETag/Last-Modified проверяет браузерный кеш, неизменные страницы приходят как 304.
+        const users = [];
+        let cursor = null;
+        do {
+            const query = cursor ? `?cursor=${cursor}` : '';
+            const response = await fetch(`${this.baseUrl}/users/${query}`, {
+                headers: this.getAuthHeaders()
+            });
+            users.push(...await response.json());
+            cursor = response.headers.get('X-Next-Cursor');
+        } while (cursor);
+        return users;
+    }
+
+    // Сервер ограничивает размер userIds (USERS_BATCH_MAX_IDS)
+    chunkUserIds(userIds, size = 500) {
+        const chunks = [];
+        for (let i = 0; i < userIds.length; i += size) {
+            chunks.push(userIds.slice(i, i + size));
+        }
+        return chunks;
     }
 
     async getUsersByIds(userIds) {
-        const response = await fetch(`${this.baseUrl}/users/batch`, {
-            method: 'POST',
-            headers: {
-                ...this.getAuthHeaders(),
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ userIds })
-        });
-        return await response.json();
+        const users = [];
+        for (const chunk of this.chunkUserIds(userIds)) {
+            const response = await fetch(`${this.baseUrl}/users/batch`, {
+                method: 'POST',
+                headers: {
+                    ...this.getAuthHeaders(),
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ userIds: chunk })
+            });
+            users.push(...await response.json());
+        }
+        return users;
     }
 
     async searchUsers(query) {
@@ -267,15 +312,19 @@ async getMessages(chatId, offset = 0, limit = 50) {
     }
 
     async getUsersStatus(userIds) {
-        const response = await fetch(`${this.baseUrl}/users/status`, {
-            method: 'POST',
-            headers: {
-                ...this.getAuthHeaders(),
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ userIds })
-        });
-        return await response.json();
+        const statuses = {};
+        for (const chunk of this.chunkUserIds(userIds)) {
+            const response = await fetch(`${this.baseUrl}/users/status`, {
+                method: 'POST',
+                headers: {
+                    ...this.getAuthHeaders(),
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ userIds: chunk })
+            });
+            Object.assign(statuses, await response.json());
+        }
+        return statuses;
     }
 
     async globalSearch(query) {
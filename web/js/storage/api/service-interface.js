@@ -44,6 +44,10 @@ class ApiServiceInterface {
         throw new Error('Method must be implemented');
     }
     
+    async getMessagesPage(chatId, { before = null, after = null, limit = 50 } = {}) {
+        throw new Error('Method must be implemented');
+    }
+    
     async searchMessages(chatId, query, limit = 50) {
         throw new Error('Method must be implemented');
     }
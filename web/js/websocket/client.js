@@ -9,6 +9,9 @@ class WebSocketClient {
         this.maxReconnectAttempts = 5;
         this.reconnectDelay = 1000; // Начальная задержка 1 сек
         this.heartbeatInterval = null;
+        this.pendingCommands = new Map(); // id команды -> {resolve, reject, timer}
+        this.commandCounter = 0;
+        this.commandTimeout = 10000;
         this.baseUrl = this.getWebSocketUrl();
     }
     
@@ -60,6 +63,13 @@ class WebSocketClient {
                 // Уведомляем о разъединении
                 this.eventBus.emit('websocket-disconnected');
                 
+                // Ответов на неподтвержденные команды уже не будет
+                this.pendingCommands.forEach(({ reject, timer }) => {
+                    clearTimeout(timer);
+                    reject(new Error('WebSocket disconnected'));
+                });
+                this.pendingCommands.clear();
+                
                 // Пытаемся переподключиться, если это не намеренное закрытие
                 if (event.code !== 1000 && this.reconnectAttempts < this.maxReconnectAttempts) {
                     this.scheduleReconnect();
@@ -101,9 +111,37 @@ class WebSocketClient {
                     this.handleUserStatus(message);
                     break;
                     
-                case 'message_received':
-                    // Эхо от сервера - игнорируем или логируем
-                    console.log('Server echo:', message);
+                case 'user_status_batch':
+                    // Сервер копит изменения статусов и шлет их пачкой
+                    message.statuses.forEach(status => this.handleUserStatus(status));
+                    break;
+                    
+                case 'typing':
+                    this.eventBus.emit('websocket-typing', {
+                        chatId: message.chatId,
+                        userId: message.userId,
+                        isTyping: message.isTyping
+                    });
+                    break;
+                    
+                case 'messages_read':
+                    // Участник чата дочитал до lastReadMessageId
+                    this.eventBus.emit('websocket-messages-read', {
+                        chatId: message.chatId,
+                        userId: message.userId,
+                        lastReadMessageId: message.lastReadMessageId
+                    });
+                    break;
+                    
+                case 'ack':
+                    this.handleAck(message);
+                    break;
+                    
+                case 'pong':
+                    break;
+                    
+                case 'error':
+                    console.error('WebSocket protocol error:', message.error);
                     break;
                     
                 default:
@@ -156,6 +194,61 @@ class WebSocketClient {
         });
     }
     
+    handleAck(ack) {
+        const pending = this.pendingCommands.get(ack.id);
+        if (!pending) return;
+        
+        clearTimeout(pending.timer);
+        this.pendingCommands.delete(ack.id);
+        
+        if (ack.ok) {
+            pending.resolve(ack.data);
+        } else {
+            pending.reject(new Error(ack.error.detail));
+        }
+    }
+    
+    // Отправка команды с ожиданием ack. Повтор с тем же id не выполнит команду дважды
+    request(type, payload = {}, id = null) {
+        const commandId = id || `${Date.now()}-${++this.commandCounter}`;
+        
+        return new Promise((resolve, reject) => {
+            const timer = setTimeout(() => {
+                this.pendingCommands.delete(commandId);
+                reject(new Error(`WebSocket command ${type} timed out`));
+            }, this.commandTimeout);
+            
+            this.pendingCommands.set(commandId, { resolve, reject, timer });
+            
+            if (!this.send({ ...payload, type, id: commandId })) {
+                clearTimeout(timer);
+                this.pendingCommands.delete(commandId);
+                reject(new Error('WebSocket is not connected'));
+            }
+        });
+    }
+    
+    // clientMessageId переживает переподключение: повтор не создаст дубль
+    sendMessage(chatId, text, clientMessageId = crypto.randomUUID()) {
+        return this.request('send_message', { chatId, text, clientMessageId });
+    }
+    
+    editMessage(messageId, text) {
+        return this.request('edit_message', { messageId, text });
+    }
+    
+    deleteMessage(messageId) {
+        return this.request('delete_message', { messageId });
+    }
+    
+    markRead(chatId, messageId = null) {
+        return this.request('mark_read', { chatId, messageId });
+    }
+    
+    sendTyping(chatId, isTyping = true) {
+        return this.send({ type: 'typing', chatId, isTyping });
+    }
+    
     scheduleReconnect() {
         this.reconnectAttempts++;
         const delay = this.reconnectDelay * Math.pow(2, this.reconnectAttempts - 1); // Экспоненциальная задержка